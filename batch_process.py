@@ -0,0 +1,197 @@
+import argparse
+import glob
+import os
+import sys
+import time
+from multiprocessing import Pool
+
+import cv2
+
+from image_io import collect_inputs, read_image, save_image
+from image_pipeline import Pipeline, Plan
+from resampling import BEST, QUALITIES
+
+
+# Recipes use the editor's operations, separated by ';':
+#   crop=x0,y0,x1,y1   resize=50%   resize=640x480   grayscale   flip
+#   brightness=20   contrast=-10   gamma=1.2   levels=16,240[,1.1]   curves=0:0,128:150,255:255
+def parse_recipe(text):
+    steps = []
+    for part in text.split(";"):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, value = part.partition("=")
+        name = name.strip().lower()
+        if name in ("grayscale", "gray"):
+            steps.append(("grayscale",))
+        elif name == "flip":
+            steps.append(("flip",))
+        elif name == "crop":
+            rect = tuple(int(v) for v in value.split(","))
+            if len(rect) != 4:
+                raise ValueError(f"crop needs x0,y0,x1,y1: {part}")
+            steps.append(("crop", rect))
+        elif name in ("brightness", "contrast", "gamma"):
+            steps.append(("adjust", ((name, float(value)),)))
+        elif name == "levels":
+            values = [float(v) for v in value.split(",")]
+            if len(values) not in (2, 3):
+                raise ValueError(f"levels needs black,white[,gamma]: {part}")
+            steps.append(("adjust", (("levels", *values),)))
+        elif name == "curves":
+            points = tuple(tuple(float(v) for v in point.split(":")) for point in value.split(","))
+            if len(points) < 2 or any(len(point) != 2 for point in points):
+                raise ValueError(f"curves needs at least two in:out points: {part}")
+            steps.append(("adjust", (("curves", points),)))
+        elif name == "resize":
+            value = value.strip().lower()
+            if value.endswith("%"):
+                steps.append(("resize", float(value[:-1]) / 100))
+            else:
+                width, height = (int(v) for v in value.split("x"))
+                steps.append(("resize", (width, height)))
+        else:
+            raise ValueError(f"Unknown operation: {part}")
+    return steps
+
+
+def resolve_recipe(steps, width, height):
+    # Turn percentages and out-of-range crops into concrete ops for one image size
+    plan = Plan(width, height)
+    ops = []
+    for step in steps:
+        w, h = plan.size
+        if step[0] == "resize" and isinstance(step[1], float):
+            op = ("resize", (max(1, int(w * step[1])), max(1, int(h * step[1]))))
+        elif step[0] == "crop":
+            x0, y0, x1, y1 = step[1]
+            x0, x1 = sorted((max(0, min(x0, w)), max(0, min(x1, w))))
+            y0, y1 = sorted((max(0, min(y0, h)), max(0, min(y1, h))))
+            if x1 - x0 < 1 or y1 - y0 < 1:
+                raise ValueError(f"Crop {step[1]} is outside a {w}x{h} image")
+            op = ("crop", (x0, y0, x1, y1))
+        else:
+            op = step
+        plan.add(op)
+        ops.append(op)
+    return ops
+
+
+def source_root(source):
+    # Directory the inputs are named relative to: the source directory itself, or the
+    # part of a glob pattern before its first wildcard
+    if os.path.isdir(source):
+        return source
+    parts = []
+    for part in source.split(os.sep):
+        if glob.has_magic(part):
+            break
+        parts.append(part)
+    else:
+        return os.path.dirname(source) or "."
+    return os.sep.join(parts) or (os.sep if source.startswith(os.sep) else ".")
+
+
+def output_path(path, out_dir, ext, root="."):
+    # Inputs keep their folder structure under out_dir, so a recursive glob does not
+    # write same-named files from different folders over each other
+    stem, old_ext = os.path.splitext(os.path.relpath(path, root))
+    return os.path.join(out_dir, stem + (ext or old_ext))
+
+
+def output_paths(paths, out_dir, ext, root="."):
+    outputs = [output_path(path, out_dir, ext, root) for path in paths]
+    seen = {}
+    for path, out_path in zip(paths, outputs):
+        key = os.path.normcase(out_path)
+        if key in seen:
+            raise ValueError(f"{seen[key]} and {path} would both be written to {out_path}")
+        seen[key] = path
+    return outputs
+
+
+def init_worker():
+    # One process per core already; keep OpenCV from starting its own threads in each
+    cv2.setNumThreads(1)
+
+
+def process_file(job):
+    path, out_path, steps, quality = job
+    try:
+        # Read and written like the editor does: native bit depth, atomic writes
+        img = read_image(path)
+        if img is None:
+            raise IOError("could not decode image")
+        ops = resolve_recipe(steps, img.shape[1], img.shape[0])
+        save_image(out_path, Pipeline(img, ops, quality=quality).render())
+        return path, None
+    except Exception as error:
+        return path, str(error)
+
+
+def run_batch(paths, out_dir, steps, ext=None, workers=None, progress=None, quality=BEST, root="."):
+    outputs = output_paths(paths, out_dir, ext, root)
+    for directory in sorted({os.path.dirname(out_path) for out_path in outputs}):
+        os.makedirs(directory, exist_ok=True)
+    jobs = [(path, out_path, steps, quality) for path, out_path in zip(paths, outputs)]
+    workers = workers or os.cpu_count() or 1
+    failures = []
+    start = time.perf_counter()
+    with Pool(processes=workers, initializer=init_worker) as pool:
+        chunksize = max(1, len(jobs) // (workers * 8))
+        for done, (path, error) in enumerate(pool.imap_unordered(process_file, jobs, chunksize), 1):
+            if error is not None:
+                failures.append((path, error))
+            if progress is not None:
+                progress(done, len(jobs))
+    elapsed = time.perf_counter() - start
+    return {
+        "images": len(jobs),
+        "failed": len(failures),
+        "failures": failures,
+        "seconds": elapsed,
+        "images_per_sec": len(jobs) / elapsed if elapsed > 0 else 0.0,
+        "workers": workers,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Apply the image editor's operations to many files.")
+    parser.add_argument("source", help="directory or glob pattern of input images")
+    parser.add_argument("recipe", help='operations, e.g. "crop=0,0,800,600;resize=50%%;grayscale;flip"')
+    parser.add_argument("-o", "--out", required=True, help="output directory")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="worker processes (default: one per core)")
+    parser.add_argument("--ext", default=None, help="output extension, e.g. .jpg (default: keep input format)")
+    parser.add_argument("--quality", choices=QUALITIES, default=BEST, help="resampling quality for resize (default: best)")
+    args = parser.parse_args(argv)
+
+    try:
+        steps = parse_recipe(args.recipe)
+    except ValueError as error:
+        parser.error(f"invalid recipe {args.recipe!r}: {error}")
+    paths = collect_inputs(args.source)
+    if not paths:
+        print(f"No images found in {args.source}", file=sys.stderr)
+        return 1
+
+    def progress(done, total):
+        if done == total or done % 100 == 0:
+            print(f"\r{done}/{total}", end="", file=sys.stderr, flush=True)
+
+    try:
+        report = run_batch(paths, args.out, steps, args.ext, args.workers, progress, args.quality,
+                           source_root(args.source))
+    except ValueError as error:
+        print(error, file=sys.stderr)
+        return 1
+    print(file=sys.stderr)
+    for path, error in report["failures"]:
+        print(f"failed: {path}: {error}", file=sys.stderr)
+    print(f"{report['images']} images in {report['seconds']:.2f}s with {report['workers']} workers "
+          f"({report['images_per_sec']:.1f} images/sec, {report['failed']} failed)")
+    return 1 if report["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+import argparse
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+
+import pygame
+
+from benchmark_editor import git_commit
+from spatial_hash import SpatialGroup
+
+DEFAULT_COUNTS = [(100, 20), (1000, 200), (5000, 1000)]   # (enemies, bullets)
+
+
+class Box(pygame.sprite.Sprite):
+    # Just a moving rect; collision checks never look at images
+    def __init__(self, rng, world, size, speed):
+        super().__init__()
+        self.rect = pygame.Rect(rng.randrange(world[0]), rng.randrange(world[1]), *size)
+        self.speed = speed
+        self.world = world
+
+    def update(self):
+        self.rect.x = (self.rect.x + self.speed) % self.world[0]
+
+
+# Each method returns {bullet: [enemies hit]} for the current positions
+def naive(bullets, enemies):
+    hits = {}
+    for bullet in bullets:
+        found = pygame.sprite.spritecollide(bullet, enemies, False)
+        if found:
+            hits[bullet] = found
+    return hits
+
+
+def groupcollide(bullets, enemies):
+    return pygame.sprite.groupcollide(bullets, enemies, False, False)
+
+
+def collidelistall(bullets, enemies):
+    sprites = enemies.sprites()
+    rects = [enemy.rect for enemy in sprites]
+    hits = {}
+    for bullet in bullets:
+        found = bullet.rect.collidelistall(rects)
+        if found:
+            hits[bullet] = [sprites[i] for i in found]
+    return hits
+
+
+def spatial(bullets, enemies):
+    enemies.rehash()
+    return enemies.groupcollide(bullets)
+
+
+METHODS = {"naive": naive, "groupcollide": groupcollide, "collidelistall": collidelistall, "spatial": spatial}
+
+
+def run(method, enemy_count, bullet_count, world, frames, seed=0):
+    rng = random.Random(seed)
+    enemies = SpatialGroup() if method == "spatial" else pygame.sprite.Group()
+    enemies.add(Box(rng, world, (50, 50), -2) for _ in range(enemy_count))
+    bullets = pygame.sprite.Group(Box(rng, world, (10, 5), 10) for _ in range(bullet_count))
+    times = []
+    collisions = 0
+    for _ in range(frames):
+        for group in (enemies, bullets):
+            for sprite in group:
+                sprite.update()
+        start = time.perf_counter()
+        hits = METHODS[method](bullets, enemies)
+        times.append(1000 * (time.perf_counter() - start))
+        collisions += sum(len(found) for found in hits.values())
+    return statistics.median(times), collisions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare collision strategies for bullets against enemies.")
+    parser.add_argument("--counts", nargs="+", default=[f"{e}x{b}" for e, b in DEFAULT_COUNTS],
+                        help="ENEMIESxBULLETS pairs")
+    parser.add_argument("--world", default="3200x2400", help="area the sprites are spread over")
+    parser.add_argument("--frames", type=int, default=30)
+    parser.add_argument("--methods", nargs="+", choices=list(METHODS), default=list(METHODS))
+    parser.add_argument("-o", "--output", default="collision_results.json")
+    args = parser.parse_args(argv)
+
+    world = tuple(int(v) for v in args.world.split("x"))
+    results = []
+    for pair in args.counts:
+        enemy_count, bullet_count = (int(v) for v in pair.split("x"))
+        for method in args.methods:
+            frame_ms, collisions = run(method, enemy_count, bullet_count, world, args.frames)
+            results.append({"method": method, "enemies": enemy_count, "bullets": bullet_count,
+                            "frame_ms": frame_ms, "collisions": collisions})
+            print(f"{method:>15} {enemy_count:>6} enemies {bullet_count:>5} bullets  {frame_ms:9.3f} ms/frame  "
+                  f"{collisions} hits", flush=True)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "world": list(world),
+            "frames": args.frames,
+            "python": platform.python_version(),
+            "pygame": pygame.version.ver,
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,347 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+
+import cv2
+import numpy as np
+
+DEFAULT_SIZES_MP = [0.3, 1, 4, 12, 24, 50]
+OPERATIONS = ["crop_image", "resize_image", "toggle_grayscale", "flip_horizontal", "push_undo", "display_image",
+              "drag_preview"]
+# The simulated crop drag: motion events this far apart, several per frame like a real mouse
+DRAG_EVENTS = 60
+DRAG_EVENT_MS = 4
+
+
+# Headless Tk: just enough of tkinter for ImageEditorApp. root.after callbacks are kept
+# in a queue that the benchmark pumps, so the editor's background jobs still complete.
+class StubWidget:
+    def __init__(self, *args, **kwargs):
+        self.options = dict(kwargs)
+        self.value = kwargs.get("value")
+        self.items = {}
+        self.next_id = 0
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+    def config(self, **kwargs):
+        self.options.update(kwargs)
+
+    configure = config
+
+    def set(self, value):
+        self.value = value
+        command = self.options.get("command")
+        if command:
+            command(str(value))
+
+    def get(self):
+        return self.value
+
+    def winfo_width(self):
+        return self.options.get("width", 900)
+
+    def winfo_height(self):
+        return self.options.get("height", 600)
+
+    def _create(self, *args, **kwargs):
+        self.next_id += 1
+        self.items[self.next_id] = kwargs.get("image")
+        return self.next_id
+
+    create_image = create_rectangle = create_text = _create
+
+    def delete(self, *items):
+        for item in items:
+            if item == "all":
+                self.items.clear()
+            else:
+                self.items.pop(item, None)
+
+
+class StubRoot(StubWidget):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pending = {}
+        self.counter = 0
+
+    def after(self, ms, func=None, *args):
+        self.counter += 1
+        self.pending[self.counter] = (time.perf_counter() + ms / 1000, func, args)
+        return self.counter
+
+    def after_idle(self, func, *args):
+        return self.after(0, func, *args)
+
+    def after_cancel(self, after_id):
+        self.pending.pop(after_id, None)
+
+    def update(self):
+        now = time.perf_counter()
+        for after_id, (due, func, args) in sorted(self.pending.items(), key=lambda item: item[1][0]):
+            if due <= now and self.pending.pop(after_id, None) is not None:
+                func(*args)
+
+
+class StubPhotoImage:
+    def __init__(self, image=None, **kwargs):
+        # Tk copies the pixels into its own image; touching every byte approximates that
+        self.size = image.size
+        image.tobytes()
+
+    def width(self):
+        return self.size[0]
+
+    def height(self):
+        return self.size[1]
+
+
+def install_tk_stub():
+    tk = types.ModuleType("tkinter")
+    for name in ["Frame", "Button", "Label", "Scale", "Canvas", "Toplevel", "Checkbutton", "Listbox",
+                 "Scrollbar", "Entry", "IntVar", "BooleanVar", "DoubleVar", "StringVar"]:
+        setattr(tk, name, StubWidget)
+    tk.Tk = StubRoot
+    for name in ["X", "Y", "LEFT", "RIGHT", "TOP", "BOTTOM", "BOTH", "HORIZONTAL", "VERTICAL",
+                 "DISABLED", "NORMAL", "END", "CENTER", "SUNKEN", "RAISED"]:
+        setattr(tk, name, name.lower())
+    dialogs = types.ModuleType("tkinter.filedialog")
+    messages = types.ModuleType("tkinter.messagebox")
+    ttk = types.ModuleType("tkinter.ttk")
+    for name in ["askopenfilename", "asksaveasfilename", "askdirectory"]:
+        setattr(dialogs, name, lambda **kwargs: "")
+    for name in ["showinfo", "showwarning", "showerror"]:
+        setattr(messages, name, lambda *args, **kwargs: None)
+    ttk.Progressbar = ttk.Combobox = StubWidget
+    tk.filedialog, tk.messagebox, tk.ttk = dialogs, messages, ttk
+    sys.modules.update({"tkinter": tk, "tkinter.filedialog": dialogs,
+                        "tkinter.messagebox": messages, "tkinter.ttk": ttk})
+
+    from PIL import ImageTk
+    ImageTk.PhotoImage = StubPhotoImage
+
+
+def synthetic_image(megapixels, seed=0):
+    # 4:3 image with smooth gradients plus noise, so encoders and resizers do real work
+    width = int(round((megapixels * 1e6 * 4 / 3) ** 0.5))
+    height = int(round(width * 3 / 4))
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    img = np.empty((height, width, 3), np.uint8)
+    img[..., 0] = (x + y) / 2
+    img[..., 1] = x
+    img[..., 2] = y
+    noise = rng.integers(0, 32, size=(height, width), dtype=np.uint8)
+    cv2.add(img, cv2.merge([noise, noise, noise]), dst=img)
+    return img
+
+
+class EditorBench:
+    # The thumbnail cache lives in `cache_dir`, or a temporary directory removed by
+    # close(), so benchmarks and tests never write to the user's own cache
+    def __init__(self, root, cache_dir=None):
+        import image_editor
+        import jobs
+        # Finished jobs are delivered on the next pump rather than after the editor's
+        # poll interval, so wall_ms measures the work and not the wait for delivery
+        jobs.POLL_MS = 0
+        self.editor = image_editor
+        self.root = root
+        self.temp_dir = tempfile.mkdtemp(prefix="editor-bench-") if cache_dir is None else None
+        cache_path = os.path.join(cache_dir or self.temp_dir, "thumbnails.sqlite")
+        self.app = image_editor.ImageEditorApp(root, thumbnail_cache_path=cache_path)
+
+    def close(self):
+        self.app.jobs.shutdown()
+        self.app.browser.close()
+        if self.temp_dir is not None:
+            shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def wait(self):
+        while self.app.jobs.busy() or self.app.jobs.polling:
+            self.root.update()
+            time.sleep(0.001)
+
+    def load(self, img):
+        from image_pipeline import Pipeline
+        self.app.close_document()
+        self.app.on_image_loaded(self.editor.render_display(Pipeline(img)))
+        self.wait()
+
+    # Each case prepares the editor state and returns the call to be measured
+    def prepare(self, op):
+        app = self.app
+        width, height = app.pipeline.size()
+        if op == "crop_image":
+            app.crop_coords = (width // 4, height // 4, 3 * width // 4, 3 * height // 4)
+            return app.crop_image
+        if op == "resize_image":
+            app.refresh_after_edit()
+            self.wait()
+
+            def resize():
+                app.resize_image("50")
+                app.commit_resize()
+            return resize
+        if op == "toggle_grayscale":
+            return app.toggle_grayscale
+        if op == "flip_horizontal":
+            return app.flip_horizontal
+        if op == "push_undo":
+            # One keyframe interval of edits, so every sample stores (and budgets) a keyframe.
+            # An adjustment, unlike a flip, makes that keyframe a rendered buffer rather than a view.
+            edit = ("adjust", (("brightness", 1),))
+
+            def push_undo():
+                for _ in range(app.history.keyframe_interval):
+                    app.pipeline.push(edit)
+                    app.push_undo(edit)
+            return push_undo
+        if op == "display_image":
+            return lambda: app.on_display_rendered(self.editor.render_display(app.pipeline.snapshot()), False)
+        if op == "drag_preview":
+            app.preview_throttle.reset_stats()
+
+            def drag():
+                app.on_button_press(types.SimpleNamespace(x=100, y=100))
+                for i in range(DRAG_EVENTS):
+                    app.on_move_press(types.SimpleNamespace(x=110 + 5 * i, y=105 + 3 * i))
+                    self.root.update()
+                    time.sleep(DRAG_EVENT_MS / 1000)
+                app.on_button_release(types.SimpleNamespace(x=110 + 5 * DRAG_EVENTS, y=105 + 3 * DRAG_EVENTS))
+            return drag
+        raise ValueError(f"Unknown operation: {op}")
+
+    def run(self, op, img, traced=False):
+        self.load(img)
+        call = self.prepare(op)
+        if traced:
+            tracemalloc.start()
+            before = tracemalloc.take_snapshot()
+        start = time.perf_counter()
+        call()
+        self.wait()
+        elapsed = 1000 * (time.perf_counter() - start)
+        if not traced:
+            return elapsed, None, None
+        _, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        allocations = sum(max(0, stat.count_diff) for stat in after.compare_to(before, "filename"))
+        return elapsed, peak / 2 ** 20, allocations
+
+    def measure(self, op, img, repeat):
+        # Timed runs go without tracemalloc, which slows every allocation; one extra
+        # traced run records peak memory and the number of new allocations
+        runs = [self.run(op, img)[0] for _ in range(repeat)]
+        _, peak_mb, allocations = self.run(op, img, traced=True)
+        result = {
+            "op": op,
+            "wall_ms": statistics.median(runs),
+            "wall_ms_runs": runs,
+            "peak_mb": peak_mb,
+            "allocations": allocations,
+        }
+        if op == "drag_preview":
+            # From the first coalesced motion event to the end of the render serving it;
+            # bounded by one frame interval plus one preview render
+            result["preview_latency"] = self.app.preview_throttle.stats()
+        return result
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(results, baseline_path, threshold, min_ms=1.0):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    old = {(r["op"], r["megapixels"]): r for r in baseline["results"]}
+    regressions = 0
+    for r in results:
+        prev = old.get((r["op"], r["megapixels"]))
+        if prev is None:
+            continue
+        ratio = r["wall_ms"] / prev["wall_ms"] if prev["wall_ms"] else float("inf")
+        flag = ""
+        if ratio > 1 + threshold and r["wall_ms"] - prev["wall_ms"] > min_ms:
+            flag = "  REGRESSION"
+            regressions += 1
+        print(f"{r['op']:>18} {r['megapixels']:>5} MP  {prev['wall_ms']:9.1f} -> {r['wall_ms']:9.1f} ms "
+              f"({ratio:5.2f}x)  peak {prev['peak_mb']:.1f} -> {r['peak_mb']:.1f} MB{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark ImageEditorApp operations across image sizes.")
+    parser.add_argument("--sizes", type=float, nargs="+", default=DEFAULT_SIZES_MP, help="megapixels")
+    parser.add_argument("--ops", nargs="+", default=OPERATIONS, choices=OPERATIONS)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--tk", choices=["auto", "stub", "real"], default="auto",
+                        help="real Tk needs a display (e.g. under Xvfb); auto uses it when DISPLAY is set")
+    parser.add_argument("-o", "--output", default="benchmark_results.json")
+    parser.add_argument("--compare", help="earlier results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="slowdown counted as a regression")
+    args = parser.parse_args(argv)
+
+    use_stub = args.tk == "stub" or (args.tk == "auto" and not os.environ.get("DISPLAY"))
+    if use_stub:
+        install_tk_stub()
+    import tkinter
+    root = tkinter.Tk()
+    bench = EditorBench(root)
+
+    results = []
+    for megapixels in args.sizes:
+        img = synthetic_image(megapixels)
+        for op in args.ops:
+            result = bench.measure(op, img, args.repeat)
+            result.update(megapixels=megapixels, width=img.shape[1], height=img.shape[0])
+            results.append(result)
+            latency = result.get("preview_latency")
+            extra = (f"  preview latency {latency['mean_latency_ms']:.1f} ms mean, {latency['max_latency_ms']:.1f} ms max"
+                     f" ({latency['runs']} renders for {latency['calls']} moves)" if latency else "")
+            print(f"{op:>18} {megapixels:>5} MP  {result['wall_ms']:9.1f} ms  peak {result['peak_mb']:7.1f} MB  "
+                  f"{result['allocations']:6d} allocs{extra}", flush=True)
+        del img
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "tk": "stub" if use_stub else "real",
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "opencv": cv2.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    bench.close()
+    if args.compare:
+        return 1 if compare(results, args.compare, args.threshold) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
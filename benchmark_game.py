@@ -0,0 +1,96 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+# Without a display the game runs on SDL's dummy drivers
+if not os.environ.get("DISPLAY"):
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import pygame
+
+import game_sim
+import rabbit_game as game
+from benchmark_editor import git_commit
+from dirty_render import FrameRenderer
+
+DEFAULT_ENEMIES = [5, 20, 80]
+
+
+def setup(enemy_count):
+    # A level-1 world as main() creates it, with `enemy_count` dragons kept on screen
+    world = game_sim.World(images=game.images)
+    world.enemies.empty()
+    world.waves = []
+    for i in range(enemy_count):
+        spawn(world, i)
+    return world
+
+
+def spawn(world, i):
+    x = game_sim.SCREEN_WIDTH - 60 - (i * 97) % (game_sim.SCREEN_WIDTH - 200)
+    y = game_sim.SCREEN_HEIGHT - 70 - (i * 53) % 400
+    enemy = game_sim.Enemy(world.images["dragon"], x, y, flying=i % 3 == 0)
+    enemy.speed_x = 1
+    world.add_enemy(enemy)
+
+
+def frame_times(world, renderer, frames, enemy_count):
+    times = []
+    spawned = enemy_count
+    for frame in range(frames):
+        start = time.perf_counter()
+        renderer.begin(world.all_sprites)
+        world.player.health = 100   # keep the level going for all `frames`
+        world.step(game_sim.SHOOT if frame % 10 == 0 else 0)
+        while len(world.enemies) < enemy_count:
+            spawn(world, spawned)
+            spawned += 1
+        game.draw_hud(renderer, world)
+        renderer.end(world.all_sprites)
+        times.append(1000 * (time.perf_counter() - start))
+    return times
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare full-screen and dirty-rectangle frame times.")
+    parser.add_argument("--enemies", type=int, nargs="+", default=DEFAULT_ENEMIES)
+    parser.add_argument("--frames", type=int, default=600)
+    parser.add_argument("-o", "--output", default="game_results.json")
+    args = parser.parse_args(argv)
+
+    results = []
+    for target in args.enemies:
+        for mode in ("full", "dirty"):
+            world = setup(target)
+            renderer = FrameRenderer(game.screen, game.background_image, dirty=mode == "dirty")
+            times = frame_times(world, renderer, args.frames, target)
+            result = {"mode": mode, "enemies": target, "frame_ms": statistics.median(times),
+                      "frame_ms_p95": sorted(times)[int(0.95 * len(times))], "frames": len(times)}
+            results.append(result)
+            print(f"{mode:>6} {target:>5} enemies  {result['frame_ms']:7.3f} ms/frame  "
+                  f"p95 {result['frame_ms_p95']:7.3f} ms", flush=True)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "video_driver": pygame.display.get_driver(),
+            "python": platform.python_version(),
+            "pygame": pygame.version.ver,
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+    pygame.quit()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
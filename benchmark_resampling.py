@@ -0,0 +1,96 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+import cv2
+import numpy as np
+import PIL
+from PIL import Image
+
+import resampling
+from benchmark_editor import git_commit, synthetic_image
+
+DEFAULT_SCALES = [0.1, 0.25, 0.5, 0.75, 1.5, 2.0]
+
+
+# Quality is the PSNR against a reference. Reductions are compared with Pillow's
+# antialiased Lanczos of the same image; enlargements start from that reduction
+# of the image and are compared with the original.
+def reference(img, size):
+    return np.asarray(Image.fromarray(img).resize(size, Image.LANCZOS))
+
+
+def psnr(img, ref):
+    mse = np.mean((img.astype(np.float64) - ref) ** 2)
+    return float("inf") if mse == 0 else 10 * np.log10(255 ** 2 / mse)
+
+
+def single_step(img, size):
+    # What resizing did before the quality modes: one area or bicubic call
+    shrink = size[0] * size[1] < img.shape[0] * img.shape[1]
+    return cv2.resize(img, size, interpolation=cv2.INTER_AREA if shrink else cv2.INTER_CUBIC)
+
+
+def measure(fn, repeat):
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        runs.append(1000 * (time.perf_counter() - start))
+    return statistics.median(runs), result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the speed and quality of the resampling modes.")
+    parser.add_argument("--megapixels", type=float, default=12)
+    parser.add_argument("--scales", type=float, nargs="+", default=DEFAULT_SCALES)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("-o", "--output", default="resampling_results.json")
+    args = parser.parse_args(argv)
+
+    img = synthetic_image(args.megapixels)[..., :3].copy()
+    height, width = img.shape[:2]
+    modes = {quality: lambda src, size, quality=quality: resampling.resize(src, size, quality)
+             for quality in resampling.QUALITIES}
+    modes["single step"] = single_step
+
+    results = []
+    for scale in args.scales:
+        if scale < 1:
+            size = (max(1, round(width * scale)), max(1, round(height * scale)))
+            src, ref = img, reference(img, size)
+        else:
+            size = (width, height)
+            src, ref = reference(img, (round(width / scale), round(height / scale))), img
+        for mode, fn in modes.items():
+            wall_ms, out = measure(lambda: fn(src, size), args.repeat)
+            results.append({"mode": mode, "scale": scale, "wall_ms": wall_ms, "psnr_db": psnr(out, ref),
+                            "input": [src.shape[1], src.shape[0]], "output": list(size)})
+            print(f"{mode:>12} x{scale:<5} {wall_ms:9.1f} ms  {results[-1]['psnr_db']:6.2f} dB", flush=True)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "megapixels": args.megapixels,
+            "python": platform.python_version(),
+            "opencv": cv2.__version__,
+            "pillow": PIL.__version__,
+            "pillow_simd": resampling.PILLOW_SIMD,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
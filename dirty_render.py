@@ -0,0 +1,55 @@
+import os
+
+import pygame
+
+# RABBIT_RENDER=dirty redraws only what changed; the default redraws the whole screen
+RENDER_ENV = "RABBIT_RENDER"
+
+
+class FrameRenderer:
+    # Draws one game frame. In full mode the background is blitted and the display
+    # flipped every frame. In dirty mode only the areas that sprites (a RenderUpdates
+    # group) and HUD overlays covered last frame or cover now are restored from the
+    # background and pushed with pygame.display.update(rects).
+    def __init__(self, screen, background, dirty=False):
+        self.screen = screen
+        self.background = background
+        self.dirty = dirty
+        self.stale = True          # screen no longer shows background + tracked sprites
+        self.full_frame = True
+        self.rects = []
+        self.overlay_rects = []    # HUD areas drawn last frame
+
+    def invalidate(self):
+        # Something else (a menu, a message) drew over the screen
+        self.stale = True
+
+    def begin(self, sprites):
+        self.full_frame = not self.dirty or self.stale
+        self.stale = False
+        if self.full_frame:
+            self.screen.blit(self.background, (0, 0))
+            self.rects = []
+        else:
+            sprites.clear(self.screen, self.background)
+            for rect in self.overlay_rects:
+                self.screen.blit(self.background, rect, rect)
+            self.rects = list(self.overlay_rects)
+        self.overlay_rects = []
+
+    def overlay(self, rect):
+        # Register a HUD element drawn this frame (the Rect returned by blit or draw)
+        if rect is not None:
+            self.overlay_rects.append(pygame.Rect(rect))
+            self.rects.append(rect)
+
+    def end(self, sprites):
+        drawn = sprites.draw(self.screen)
+        if self.full_frame or self.stale:
+            pygame.display.flip()
+        else:
+            pygame.display.update(self.rects + list(drawn or []))
+
+
+def dirty_enabled():
+    return os.environ.get(RENDER_ENV, "").lower() == "dirty"
@@ -0,0 +1,211 @@
+import copy
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+from PIL import Image, ImageTk
+
+import filters
+from instrumentation import stage
+
+TILE_SIZE = 256
+TILE_CACHE_SIZE = 256   # Tk images kept around for tiles that scroll back into view
+MIN_ZOOM = 1 / 64
+MAX_ZOOM = 16
+
+
+def to_pil(img):
+    # Screen image from an 8-bit GRAY/BGR/BGRA array. Contiguous gray buffers are
+    # wrapped without copying; color needs one BGR->RGB pass over the (small) array.
+    if img.ndim == 2:
+        if img.flags["C_CONTIGUOUS"]:
+            return Image.frombuffer("L", (img.shape[1], img.shape[0]), img, "raw", "L", 0, 1)
+        return Image.fromarray(img)
+    code = cv2.COLOR_BGRA2RGBA if img.shape[2] == 4 else cv2.COLOR_BGR2RGB
+    return Image.fromarray(cv2.cvtColor(img, code))
+
+
+class DisplayPyramid:
+    # Multi-resolution copy of the 8-bit display image in its native layout (GRAY or
+    # BGR). Level k is 2**k times smaller than the full-resolution level 0, which is
+    # shared with the image rather than copied.
+    def __init__(self, img, tile_size=TILE_SIZE):
+        self.tile_size = tile_size
+        self.lut = None
+        self.levels = [np.asarray(img)]
+        # A mirrored view (negative column stride) is reduced in its stored orientation
+        # and only the much smaller levels are flipped, instead of copying level 0
+        mirrored = self.levels[0].strides[1] < 0
+        prev = self.levels[0][:, ::-1] if mirrored else self.levels[0]
+        with stage("pyramid.build"):
+            while max(prev.shape[:2]) > tile_size:
+                size = (max(1, prev.shape[1] // 2), max(1, prev.shape[0] // 2))
+                prev = cv2.resize(prev, size, interpolation=cv2.INTER_AREA)
+                self.levels.append(cv2.flip(prev, 1) if mirrored else prev)
+
+    def adjusted(self, lut):
+        # The same levels and size seen through a tone lookup table, applied to each
+        # tile or region as it is read, so nothing is processed ahead of drawing
+        pyramid = copy.copy(self)
+        pyramid.lut = lut
+        return pyramid
+
+    def _read(self, img):
+        return img if self.lut is None else filters.apply_lut(img, self.lut)
+
+    @property
+    def width(self):
+        return self.levels[0].shape[1]
+
+    @property
+    def height(self):
+        return self.levels[0].shape[0]
+
+    def level_for(self, zoom):
+        # Smallest level that still has at least `zoom` pixels per full-res pixel
+        level = 0
+        while level + 1 < len(self.levels) and 2.0 ** -(level + 1) >= zoom:
+            level += 1
+        return level
+
+    def region(self, rect, min_side):
+        # Full-res rect read from the smallest level where it is still `min_side` px on its long side
+        x0, y0, x1, y1 = rect
+        level = 0
+        while level + 1 < len(self.levels) and max(x1 - x0, y1 - y0) >> (level + 1) >= min_side:
+            level += 1
+        x0, y0, x1, y1 = x0 >> level, y0 >> level, x1 >> level, y1 >> level
+        return self._read(self.levels[level][y0:max(y0 + 1, y1), x0:max(x0 + 1, x1)])
+
+    def tile(self, level, tx, ty):
+        return self._read(self._tile(level, tx, ty))
+
+    def tile_shape(self, level, tx, ty):
+        return self._tile(level, tx, ty).shape[:2]
+
+    def _tile(self, level, tx, ty):
+        t = self.tile_size
+        return self.levels[level][ty * t:(ty + 1) * t, tx * t:(tx + 1) * t]
+
+
+class CanvasViewport:
+    # Shows a DisplayPyramid on a Tk canvas. Only the tiles that intersect the
+    # visible area are converted to Tk images; zoom and pan move the view origin.
+    def __init__(self, canvas):
+        self.canvas = canvas
+        self.pyramid = None
+        self.zoom = 1.0
+        self.origin = (0.0, 0.0)   # full-res pixel shown at the canvas' top-left corner
+        self.tile_cache = OrderedDict()
+        self.tile_items = []
+        self.tile_images = []   # keeps the visible tiles alive even if evicted from the cache
+
+    def show_pyramid(self, pyramid, fit=True):
+        # The pyramid may have been built on a worker thread; this part must run on Tk's
+        self.pyramid = pyramid
+        self.tile_cache.clear()
+        if fit:
+            self.fit()
+        else:
+            self.redraw()
+
+    def clear(self):
+        self.pyramid = None
+        self.tile_cache.clear()
+        self.redraw()
+
+    def view_size(self):
+        return max(1, self.canvas.winfo_width()), max(1, self.canvas.winfo_height())
+
+    def fit(self):
+        # Fit the whole image in the canvas, never enlarging it past 100%
+        cw, ch = self.view_size()
+        self.zoom = min(1.0, cw / self.pyramid.width, ch / self.pyramid.height)
+        self.origin = (0.0, 0.0)
+        self.redraw()
+
+    def show_scaled(self, width, height):
+        # Preview the image as if it were resized to width x height, using the existing levels
+        cw, ch = self.view_size()
+        fit = min(1.0, cw / width, ch / height)
+        self.zoom = fit * width / self.pyramid.width
+        self.origin = (0.0, 0.0)
+        self.redraw()
+
+    def zoom_at(self, factor, cx, cy):
+        # Keep the image point under (cx, cy) fixed while zooming
+        if self.pyramid is None:
+            return
+        ix, iy = self.canvas_to_image(cx, cy, clamp=False)
+        self.zoom = min(MAX_ZOOM, max(MIN_ZOOM, self.zoom * factor))
+        self.origin = (ix - cx / self.zoom, iy - cy / self.zoom)
+        self.redraw()
+
+    def pan(self, dx, dy):
+        if self.pyramid is None:
+            return
+        self.origin = (self.origin[0] - dx / self.zoom, self.origin[1] - dy / self.zoom)
+        self.redraw()
+
+    def canvas_to_image(self, x, y, clamp=True):
+        ix = self.origin[0] + x / self.zoom
+        iy = self.origin[1] + y / self.zoom
+        if not clamp:
+            return ix, iy
+        return (max(0, min(int(ix), self.pyramid.width - 1)),
+                max(0, min(int(iy), self.pyramid.height - 1)))
+
+    def image_to_canvas(self, x, y):
+        return (x - self.origin[0]) * self.zoom, (y - self.origin[1]) * self.zoom
+
+    def redraw(self):
+        with stage("canvas.redraw"):
+            self._redraw()
+
+    def _redraw(self):
+        for item in self.tile_items:
+            self.canvas.delete(item)
+        self.tile_items = []
+        self.tile_images = []
+        if self.pyramid is None:
+            return
+
+        level = self.pyramid.level_for(self.zoom)
+        scale = 2 ** level * self.zoom               # canvas pixels per level pixel
+        span = self.pyramid.tile_size * 2 ** level   # full-res pixels covered by one tile
+        cw, ch = self.view_size()
+        x0, y0 = self.canvas_to_image(0, 0, clamp=False)
+        x1, y1 = self.canvas_to_image(cw, ch, clamp=False)
+        tx0, ty0 = max(0, int(x0 // span)), max(0, int(y0 // span))
+        tx1 = min(int(x1 // span), (self.pyramid.width - 1) // span)
+        ty1 = min(int(y1 // span), (self.pyramid.height - 1) // span)
+
+        for ty in range(ty0, ty1 + 1):
+            for tx in range(tx0, tx1 + 1):
+                tile_h, tile_w = self.pyramid.tile_shape(level, tx, ty)
+                left, top = self.image_to_canvas(tx * span, ty * span)
+                # Sizes depend only on the zoom so panning keeps hitting the tile cache
+                size = (max(1, round(tile_w * scale)), max(1, round(tile_h * scale)))
+                tk_img = self._tk_tile(level, tx, ty, size)
+                self.tile_images.append(tk_img)
+                self.tile_items.append(self.canvas.create_image(round(left), round(top), anchor="nw",
+                                                                image=tk_img, tags="tile"))
+        self.canvas.tag_lower("tile")
+
+    def _tk_tile(self, level, tx, ty, size):
+        key = (level, tx, ty, size)
+        tk_img = self.tile_cache.get(key)
+        if tk_img is not None:
+            self.tile_cache.move_to_end(key)
+            return tk_img
+        with stage("tile.cvtColor"):
+            pil_tile = to_pil(self.pyramid.tile(level, tx, ty))
+        if pil_tile.size != size:
+            with stage("tile.resize"):
+                pil_tile = pil_tile.resize(size, Image.BILINEAR)
+        with stage("tile.PhotoImage"):
+            tk_img = ImageTk.PhotoImage(pil_tile)
+        self.tile_cache[key] = tk_img
+        if len(self.tile_cache) > TILE_CACHE_SIZE:
+            self.tile_cache.popitem(last=False)
+        return tk_img
@@ -0,0 +1,129 @@
+import itertools
+import os
+
+import numpy as np
+
+from image_ops import resident_bytes, root
+
+DEFAULT_BUDGET_MB = 256
+DEFAULT_KEYFRAME_INTERVAL = 8
+
+_spill_names = itertools.count()
+
+
+def compact(img, shared=()):
+    # Keyframes share memory with the buffers the history already holds (a crop of the
+    # base is a view of it). A view that covers only part of any other buffer is copied
+    # so it does not keep that large parent alive; memory maps live on disk anyway.
+    owner = root(img)
+    if isinstance(owner, np.memmap) or owner.nbytes <= img.nbytes:
+        return img
+    if any(owner is root(held) for held in shared):
+        return img
+    return img.copy()
+
+
+class EditHistory:
+    # Stores edits as operations instead of full frames. Every few operations the
+    # resulting image is kept as a keyframe; any state is rebuilt by replaying the
+    # operations that follow the nearest keyframe before it. `render` arguments are
+    # callables so the current image is only evaluated when a keyframe is taken; one
+    # that returns None skips the keyframe for that state.
+    def __init__(self, base, budget_mb=DEFAULT_BUDGET_MB, keyframe_interval=DEFAULT_KEYFRAME_INTERVAL):
+        self.budget_bytes = int(budget_mb * 1024 * 1024)
+        self.keyframe_interval = max(1, keyframe_interval)
+        self.reset(base)
+
+    def reset(self, base):
+        self.base = compact(base)
+        self.entries = []  # [op, keyframe or None]
+        self.cursor = 0    # number of entries applied to reach the current state
+
+    def can_undo(self):
+        return self.cursor > 0
+
+    def can_redo(self):
+        return self.cursor < len(self.entries)
+
+    def top_op(self):
+        if self.cursor == 0:
+            return None
+        return self.entries[self.cursor - 1][0]
+
+    def arrays(self):
+        return [self.base] + [kf for _, kf in self.entries if kf is not None]
+
+    def memory_bytes(self):
+        # RAM actually held: shared buffers count once, memory maps not at all
+        return resident_bytes(self.arrays())
+
+    def push(self, op, render):
+        # Recording a new edit drops everything that could have been redone
+        del self.entries[self.cursor:]
+        self.entries.append([op, None])
+        self.cursor += 1
+        self._store_keyframe(render)
+
+    def replace_top(self, op, render):
+        # Used for edits that are refined continuously (e.g. the resize slider)
+        del self.entries[self.cursor:]
+        self.entries[self.cursor - 1] = [op, None]
+        self._store_keyframe(render)
+
+    # undo/redo return the checkpoint of the new state; the caller replays it
+    def undo(self):
+        self.cursor -= 1
+        return self.checkpoint()
+
+    def redo(self):
+        self.cursor += 1
+        return self.checkpoint()
+
+    def checkpoint(self, index=None):
+        # Nearest keyframe at or before `index` and the ops that follow it
+        if index is None:
+            index = self.cursor
+        start = self._keyframe_index(index)
+        img = self.base if start == 0 else self.entries[start - 1][1]
+        return img, [op for op, _ in self.entries[start:index]]
+
+    def _keyframe_index(self, index):
+        while index > 0 and self.entries[index - 1][1] is None:
+            index -= 1
+        return index
+
+    def _store_keyframe(self, render):
+        if self.cursor - self._keyframe_index(self.cursor - 1) < self.keyframe_interval:
+            return
+        keyframe = render()
+        if keyframe is None:
+            return
+        keyframe = compact(keyframe, self.arrays())
+        # Make room by dropping the oldest entries; the oldest keyframe becomes the new base
+        while resident_bytes(self.arrays() + [keyframe]) > self.budget_bytes:
+            oldest = next((i for i, (_, kf) in enumerate(self.entries[:self.cursor]) if kf is not None), None)
+            if oldest is None:
+                break
+            self.base = self.entries[oldest][1]
+            del self.entries[:oldest + 1]
+            self.cursor -= oldest + 1
+        if resident_bytes(self.arrays() + [keyframe]) <= self.budget_bytes:
+            self.entries[self.cursor - 1][1] = keyframe
+
+    def spill(self, directory):
+        # Move the base and keyframes out of memory while the image is not being edited.
+        # They are swapped for read-only memory maps of .npy files, so nothing needs to
+        # be restored: pages are read back only when a state is replayed.
+        os.makedirs(directory, exist_ok=True)
+
+        def save(img):
+            if isinstance(img, np.memmap):
+                return img  # already on disk
+            path = os.path.join(directory, f"keyframe{next(_spill_names)}.npy")
+            np.save(path, img)
+            return np.load(path, mmap_mode="r")
+
+        self.base = save(self.base)
+        for entry in self.entries:
+            if entry[1] is not None:
+                entry[1] = save(entry[1])
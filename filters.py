@@ -0,0 +1,86 @@
+import cv2
+import numpy as np
+
+import tiling
+
+# Tone adjustments are curves on values normalized to 0..1. A stack of them is
+# evaluated once per possible input value into a single lookup table, so any
+# number of stacked adjustments costs one table lookup per pixel:
+#   ("brightness", amount)          amount -100..100, shifts all values
+#   ("contrast", amount)            amount -100..100, stretches around mid-gray
+#   ("gamma", value)                value > 0, above 1 brightens the midtones
+#   ("levels", black, white[, gamma])  input black/white points on the 0..255 scale
+#   ("curves", ((in, out), ...))    control points on the 0..255 scale, linear between
+
+NEUTRAL = {"brightness": 0, "contrast": 0, "gamma": 1.0}
+
+
+def brightness(x, amount):
+    return x + amount / 100
+
+
+def contrast(x, amount):
+    return (x - 0.5) * max(0.0, 1 + amount / 100) + 0.5
+
+
+def gamma(x, value):
+    return x ** (1 / max(value, 1e-3))
+
+
+def levels(x, black, white, value=1.0):
+    black, white = black / 255, max(white, black + 1) / 255
+    return gamma(np.clip((x - black) / (white - black), 0, 1), value)
+
+
+def curves(x, points):
+    points = sorted(points)
+    return np.interp(x, [p[0] / 255 for p in points], [p[1] / 255 for p in points])
+
+
+ADJUSTMENTS = {
+    "brightness": brightness,
+    "contrast": contrast,
+    "gamma": gamma,
+    "levels": levels,
+    "curves": curves,
+}
+
+
+def is_identity(adjustments):
+    return all(adj[0] in NEUTRAL and adj[1] == NEUTRAL[adj[0]] for adj in adjustments)
+
+
+def build_lut(adjustments, dtype=np.uint8):
+    # One table for the whole stack, over every value of an 8- or 16-bit channel.
+    # Intermediate results stay in floating point and are only rounded at the end.
+    top = np.iinfo(dtype).max
+    x = np.linspace(0.0, 1.0, top + 1)
+    for name, *args in adjustments:
+        if name not in ADJUSTMENTS:
+            raise ValueError(f"Unknown adjustment: {name}")
+        x = np.clip(ADJUSTMENTS[name](x, *args), 0, 1)
+    return np.rint(x * top).astype(dtype)
+
+
+def apply_lut(img, table, out=None):
+    # Color channels go through the table; alpha is left alone
+    channels = 1 if img.ndim == 2 else img.shape[2]
+    if img.dtype == np.uint8:
+        if channels == 4:
+            table = np.stack([table] * 3 + [np.arange(256, dtype=np.uint8)], axis=-1)
+        table = table.reshape((1, 256) + table.shape[1:])
+
+        def fn(src, dst):
+            return cv2.LUT(src, table, dst=dst)
+    elif img.dtype == np.uint16:
+        # cv2.LUT only takes 8-bit input; indexing does the same for 16-bit values
+        def fn(src, dst):
+            if channels == 4:
+                dst[..., 3] = src[..., 3]
+                dst[..., :3] = table[src[..., :3]]
+            else:
+                np.take(table, src, out=dst)
+            return dst
+    else:
+        raise ValueError(f"Adjustments need 8- or 16-bit images, not {img.dtype}")
+    return tiling.map_rows(fn, img, img.shape, img.dtype, out)
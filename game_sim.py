@@ -0,0 +1,392 @@
+import argparse
+import math
+import os
+import random
+import sys
+import time
+
+import pygame
+
+from spatial_hash import SpatialGroup
+
+# The game world without a window: sprites, waves, collisions and level flow, advanced
+# in fixed steps by World.step(inputs). rabbit_game.py feeds it keyboard input and
+# draws it; bots, balance checks and benchmarks can drive it directly and as fast as
+# the CPU allows (`python game_sim.py`).
+
+SCREEN_WIDTH = 800
+SCREEN_HEIGHT = 600
+TICK_RATE = 60                 # steps per second of game time
+STEP_MS = 1000 / TICK_RATE
+GRAVITY = 1
+LEVEL_DURATION = 60000         # ms of game time before a level ends by itself
+LEVEL_COMPLETE_DELAY = 2000    # ms the "Level Complete!" screen stays up
+LAST_LEVEL = 3
+GAME = "rabbit"                # names the game in input recordings (replay.py)
+RED = (255, 0, 0)
+
+# Inputs for one step, OR-ed together. LEFT and RIGHT are held keys; JUMP and SHOOT
+# are presses since the previous step.
+LEFT = 1
+RIGHT = 2
+JUMP = 4
+SHOOT = 8
+
+# World.state
+PLAYING = "playing"
+LEVEL_COMPLETE = "level_complete"
+WON = "won"
+LOST = "lost"
+
+
+class Controls:
+    # Turns key events into inputs: the arrows held now, plus the jumps and shots
+    # pressed since the last step
+    HELD = {pygame.K_LEFT: LEFT, pygame.K_RIGHT: RIGHT}
+    PRESSED = {pygame.K_UP: JUMP, pygame.K_SPACE: SHOOT}
+
+    def __init__(self):
+        self.held = 0
+        self.pressed = 0
+
+    def handle(self, event):
+        if event.type == pygame.KEYDOWN:
+            self.held |= self.HELD.get(event.key, 0)
+            self.pressed |= self.PRESSED.get(event.key, 0)
+        elif event.type == pygame.KEYUP:
+            self.held &= ~self.HELD.get(event.key, 0)
+
+    def take(self):
+        inputs = self.held | self.pressed
+        self.pressed = 0
+        return inputs
+
+
+class TickClock:
+    # Game time in ms. It only moves when the world steps, so a level lasts the same
+    # number of steps however fast or slow they are run. Any object with ticks() and
+    # advance(ms) can be passed to World instead.
+    def __init__(self, start=0):
+        self.ms = start
+
+    def ticks(self):
+        return self.ms
+
+    def advance(self, ms):
+        self.ms += ms
+
+
+def placeholder_images():
+    # Plain surfaces of the real sprites' sizes, so the world runs without loading assets
+    player = pygame.Surface((50, 50))
+    player.fill((255, 255, 255))
+    dragon = pygame.Surface((50, 50))
+    dragon.fill((0, 128, 0))
+    return {"player": player, "dragon": dragon}
+
+
+class Player(pygame.sprite.Sprite):
+    def __init__(self, image):
+        super().__init__()
+        self.image = image
+        self.rect = self.image.get_rect()
+        self.rect.x = 100
+        self.rect.y = SCREEN_HEIGHT - 70
+        self.speed_x = 0
+        self.speed_y = 0
+        self.is_jumping = False
+        self.health = 100
+        self.lives = 3
+        self.score = 0
+
+    def update(self):
+        self.rect.x += self.speed_x
+        self.speed_y += GRAVITY
+        self.rect.y += self.speed_y
+
+        if self.rect.y > SCREEN_HEIGHT - 70:
+            self.rect.y = SCREEN_HEIGHT - 70
+            self.is_jumping = False
+            self.speed_y = 0
+
+        if self.rect.x < 0:
+            self.rect.x = 0
+        elif self.rect.x > SCREEN_WIDTH - self.rect.width:
+            self.rect.x = SCREEN_WIDTH - self.rect.width
+
+    def jump(self):
+        if not self.is_jumping:
+            self.speed_y = -15
+            self.is_jumping = True
+
+    def move_left(self):
+        self.speed_x = -5
+
+    def move_right(self):
+        self.speed_x = 5
+
+    def stop(self):
+        self.speed_x = 0
+
+
+class Projectile(pygame.sprite.Sprite):
+    def __init__(self, x, y):
+        super().__init__()
+        self.image = pygame.Surface((10, 5))
+        self.image.fill(RED)
+        self.rect = self.image.get_rect()
+        self.rect.center = (x, y)
+        self.speed_x = 10
+
+    def update(self):
+        self.rect.x += self.speed_x
+        if self.rect.x > SCREEN_WIDTH:
+            self.kill()
+
+
+class Enemy(pygame.sprite.Sprite):
+    def __init__(self, image, x, y, flying=False):
+        super().__init__()
+        self.image = image
+        self.rect = self.image.get_rect()
+        self.rect.x = x
+        self.flying = flying
+        self.base_y = y
+        self.rect.y = y
+        self.health = 30
+        self.speed_x = 2
+        self.jump_direction = 1
+        self.jump_range = 40
+        self.jump_counter = 0
+
+    def update(self):
+        self.rect.x -= self.speed_x
+        if self.flying:
+            self.jump_counter += self.jump_direction
+            self.rect.y = self.base_y + int(self.jump_range * math.sin(self.jump_counter * 0.1))
+            if abs(self.jump_counter) > 60:
+                self.jump_direction *= -1
+        if self.health <= 0:
+            self.kill()
+        if self.rect.right < 0:
+            self.kill()
+
+
+class BossEnemy(pygame.sprite.Sprite):
+    def __init__(self, image, rng, health=150):
+        super().__init__()
+        self.rng = rng
+        self.image = pygame.transform.scale(image, (120, 120))
+        self.rect = self.image.get_rect()
+        self.rect.x = SCREEN_WIDTH
+        self.rect.y = SCREEN_HEIGHT - 150
+        self.health = health
+
+    def update(self):
+        self.rect.x -= self.rng.randint(1, 3)
+        if self.health <= 0:
+            self.kill()
+        if self.rect.right < 0:
+            self.kill()
+
+
+class World:
+    # All game state. step() advances it by STEP_MS of game time and returns the
+    # events of that step ("shoot", "hit", "player_hit", "life_lost", "level_complete",
+    # "level_start", "won", "lost") for the caller to play sounds or log. All randomness
+    # comes from self.rng, so the same seed and inputs always play out the same way.
+    def __init__(self, images=None, clock=None, seed=None):
+        self.images = images or placeholder_images()
+        self.clock = clock or TickClock()
+        self.seed = random.randrange(2 ** 32) if seed is None else seed
+        self.rng = random.Random(self.seed)
+        # RenderUpdates reports where sprites were drawn, for the dirty-rectangle mode
+        self.all_sprites = pygame.sprite.RenderUpdates()
+        self.projectiles = pygame.sprite.Group()
+        # Enemies are also filed in a grid, so collision checks only look at nearby ones
+        self.enemies = SpatialGroup()
+        self.player = Player(self.images["player"])
+        self.level = 1
+        self.state = PLAYING
+        self.steps = 0
+        self.events = []
+        self.start_level(self.level)
+
+    @property
+    def finished(self):
+        return self.state in (WON, LOST)
+
+    def time_left(self):
+        # Whole seconds before the level ends by itself
+        elapsed = self.clock.ticks() - self.level_start_time
+        return int(max(0, (LEVEL_DURATION - elapsed) // 1000))
+
+    def add_enemy(self, enemy):
+        self.all_sprites.add(enemy)
+        self.enemies.add(enemy)
+
+    def start_level(self, level_num):
+        self.enemies.empty()
+        self.all_sprites.empty()
+        self.projectiles.empty()
+        self.all_sprites.add(self.player)
+        self.current_wave = 0
+        dragon = self.images["dragon"]
+
+        if level_num == 1:
+            self.waves = [
+                [(SCREEN_WIDTH + 100 * i, SCREEN_HEIGHT - 70) for i in range(5)],
+                [(SCREEN_WIDTH + 150 * i, SCREEN_HEIGHT - 70) for i in range(6)]
+            ]
+        elif level_num == 2:
+            self.waves = [
+                [(SCREEN_WIDTH + 80 * i, SCREEN_HEIGHT - 70) for i in range(7)]
+            ]
+            self.add_enemy(BossEnemy(dragon, self.rng, health=150))
+        elif level_num == 3:
+            self.waves = [
+                [(SCREEN_WIDTH + 120 * i, SCREEN_HEIGHT - 70) for i in range(4)]
+            ]
+            for i in range(3):
+                self.add_enemy(Enemy(dragon, SCREEN_WIDTH + 180 * i, SCREEN_HEIGHT - 150, flying=True))
+            self.add_enemy(BossEnemy(dragon, self.rng, health=200))
+
+        self.level_start_time = self.clock.ticks()
+        self.state = PLAYING
+
+    def apply_inputs(self, inputs):
+        player = self.player
+        held = inputs & (LEFT | RIGHT)
+        if held == LEFT:
+            player.move_left()
+        elif held == RIGHT:
+            player.move_right()
+        elif not held:
+            player.stop()
+        if inputs & JUMP:
+            player.jump()
+        if inputs & SHOOT:
+            bullet = Projectile(player.rect.centerx, player.rect.centery)
+            self.all_sprites.add(bullet)
+            self.projectiles.add(bullet)
+            self.events.append("shoot")
+
+    def step(self, inputs=0):
+        self.events = []
+        if self.state == PLAYING:
+            self.apply_inputs(inputs)
+            self.play()
+        elif self.state == LEVEL_COMPLETE:
+            if self.clock.ticks() - self.level_complete_time > LEVEL_COMPLETE_DELAY:
+                self.next_level()
+        self.clock.advance(STEP_MS)
+        self.steps += 1
+        return self.events
+
+    def complete_level(self):
+        self.state = LEVEL_COMPLETE
+        self.level_complete_time = self.clock.ticks()
+        self.events.append("level_complete")
+
+    def next_level(self):
+        self.level += 1
+        if self.level > LAST_LEVEL:
+            self.state = WON
+            self.events.append("won")
+            return
+        self.player.health = 100
+        self.player.lives = max(self.player.lives, 1)
+        self.start_level(self.level)
+        self.events.append("level_start")
+
+    def play(self):
+        player = self.player
+        self.all_sprites.update()
+        self.enemies.rehash()
+
+        if self.clock.ticks() - self.level_start_time > LEVEL_DURATION:
+            self.complete_level()
+            return
+
+        for bullet, enemies_hit in self.enemies.groupcollide(self.projectiles).items():
+            for enemy in enemies_hit:
+                enemy.health -= 10
+                bullet.kill()
+                player.score += 10
+                self.events.append("hit")
+
+        for hit in self.enemies.collide(player):
+            player.health -= 1
+            self.events.append("player_hit")
+            if player.health <= 0:
+                player.lives -= 1
+                player.health = 100
+                self.events.append("life_lost")
+                if player.lives <= 0:
+                    self.state = LOST
+                    self.events.append("lost")
+                    return
+
+        if len(self.enemies) == 0:
+            if self.current_wave < len(self.waves):
+                for x, y in self.waves[self.current_wave]:
+                    self.add_enemy(Enemy(self.images["dragon"], x, y, flying=(self.level == 3)))
+                self.current_wave += 1
+            elif self.waves:
+                self.complete_level()
+
+
+def bot(world):
+    # A simple player for headless runs: keep firing, jump over what comes close
+    inputs = SHOOT if world.steps % 8 == 0 else 0
+    player = world.player.rect
+    for enemy in world.enemies.query(player.inflate(120, 0).move(60, 0)):
+        if enemy.rect.left >= player.left:
+            inputs |= JUMP
+            break
+    return inputs
+
+
+def idle(world):
+    return 0
+
+
+POLICIES = {"bot": bot, "idle": idle}
+
+
+def run(world, policy, max_steps):
+    # Step `world` until it is won or lost (or `max_steps` pass) as fast as possible
+    while not world.finished and world.steps < max_steps:
+        world.step(policy(world))
+    return world
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the game without a window, as fast as possible.")
+    parser.add_argument("--policy", choices=list(POLICIES), default="bot")
+    parser.add_argument("--games", type=int, default=1)
+    parser.add_argument("--seed", type=int, help="seed of the first game; later games count up from it")
+    parser.add_argument("--max-steps", type=int, default=int(LAST_LEVEL * (LEVEL_DURATION + LEVEL_COMPLETE_DELAY) / STEP_MS) + 10)
+    args = parser.parse_args(argv)
+
+    pygame.init()
+    total_steps = 0
+    start = time.perf_counter()
+    for game in range(args.games):
+        seed = None if args.seed is None else args.seed + game
+        world = run(World(seed=seed), POLICIES[args.policy], args.max_steps)
+        total_steps += world.steps
+        print(f"game {game} (seed {world.seed}): {world.state} at level {min(world.level, LAST_LEVEL)}, score {world.player.score}, "
+              f"lives {world.player.lives}, {world.steps} steps ({world.steps / TICK_RATE:.1f}s of game time)")
+    elapsed = time.perf_counter() - start
+    print(f"{total_steps} steps in {elapsed:.2f}s: {total_steps / elapsed:.0f} steps/s "
+          f"({total_steps / elapsed / TICK_RATE:.0f}x real time)")
+    pygame.quit()
+    return 0
+
+
+if __name__ == "__main__":
+    # Nothing is shown, but pygame is still initialised; keep SDL off any real display
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    sys.exit(main())
@@ -0,0 +1,55 @@
+import os
+from collections import OrderedDict
+
+import pygame
+
+# Set RABBIT_DEBUG=1 (or press F3 in the game) to show the text cache hit rate
+DEBUG_ENV = "RABBIT_DEBUG"
+CACHE_SIZE = 256   # rendered strings kept; a HUD needs a few dozen at most
+
+
+class TextCache:
+    # Fonts are loaded once per size and rendered surfaces are kept by (text, size,
+    # color), so a HUD line is only rasterized again when its value changes
+    def __init__(self, font_name=None, max_entries=CACHE_SIZE):
+        self.font_name = font_name
+        self.max_entries = max_entries
+        self.fonts = {}
+        self.surfaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def font(self, size):
+        font = self.fonts.get(size)
+        if font is None:
+            font = self.fonts[size] = pygame.font.Font(self.font_name, size)
+        return font
+
+    def render(self, text, size, color):
+        key = (text, size, tuple(color))
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.hits += 1
+            self.surfaces.move_to_end(key)
+            return surface
+        self.misses += 1
+        surface = self.surfaces[key] = self.font(size).render(text, True, color)
+        if len(self.surfaces) > self.max_entries:
+            self.surfaces.popitem(last=False)
+        return surface
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        return (f"text cache: {self.hit_rate():.1%} hits ({self.hits}/{self.hits + self.misses}), "
+                f"{len(self.surfaces)} surfaces, {len(self.fonts)} fonts")
+
+    def draw_stats(self, surface, pos, color=(255, 255, 0)):
+        # Rendered directly, as the line changes every frame and would only churn the cache
+        return surface.blit(self.font(20).render(self.stats(), True, color), pos)
+
+
+def debug_enabled():
+    return os.environ.get(DEBUG_ENV, "") not in ("", "0")
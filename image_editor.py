@@ -1,49 +1,171 @@
+import copy
+import os
+import tempfile
 import tkinter as tk
-from tkinter import filedialog, messagebox
-from PIL import Image, ImageTk
-import cv2
-import numpy as np
+from tkinter import filedialog, messagebox, ttk
+from PIL import ImageTk
+
+import filters
+import region_export
+import tiling
+from display_pyramid import CanvasViewport, DisplayPyramid, to_pil
+from edit_history import EditHistory
+from image_io import ENCODER_DEFAULTS, choose_reduction, format_for, probe_size, read_image, save_image
+from image_pipeline import Pipeline
+from resampling import BEST
+from instrumentation import HUD_ENV, instruments, memory_mb, timed
+from jobs import JobRunner
+from scheduling import Debouncer, FrameThrottle
+from session import Document, Session
+from thumbnail_browser import ThumbnailBrowser
+from thumbnail_cache import DEFAULT_CACHE_PATH, ThumbnailCache
+
+# Memory the undo/redo history may use for its keyframes
+HISTORY_BUDGET_MB = 256
+# Memory for the open images that are not being edited (decoded buffers, display
+# pyramids, undo keyframes); beyond it the least recently shown ones are evicted
+SESSION_CACHE_MB = 1024
+# Filmstrip thumbnail size
+THUMB_SIZE = 80
+# Decoded images larger than this are backed by a temporary memory-mapped file and
+# processed out of core
+MEMMAP_THRESHOLD_MB = tiling.OUT_OF_CORE_MB
+# Long side of the reduced-resolution decode shown while the full image loads
+FIRST_PAINT_SIZE = 1600
+# Refresh interval of the timing overlay
+HUD_MS = 250
+# Format of exported regions; lossless, since they are usually further processed
+REGION_EXT = ".png"
+
+
+# Worker-thread functions: they only touch their arguments, never Tk or the app state
+@timed("decode.preview")
+def decode_preview(path):
+    # Quick reduced-resolution decode for the first paint, None if not worth it
+    size = probe_size(path)
+    reduce = choose_reduction(size, FIRST_PAINT_SIZE)
+    if reduce == 1:
+        return None
+    return size, DisplayPyramid(read_image(path, reduce))
+
+
+@timed("decode")
+def decode_image(path):
+    width, height = probe_size(path)
+    memmap_path = None
+    if width * height * 3 > MEMMAP_THRESHOLD_MB * 1024 * 1024:
+        fd, memmap_path = tempfile.mkstemp(suffix=".bgr")
+        os.close(fd)
+    try:
+        bgr = read_image(path, memmap_path=memmap_path)
+    finally:
+        # The mapping stays valid after the file name is removed
+        if memmap_path is not None:
+            os.unlink(memmap_path)
+    if bgr is None:
+        raise IOError(f"Could not read {path}")
+    return render_display(Pipeline(bgr))
+
+
+def render_display(snapshot):
+    with instruments.stage("render"):
+        snapshot.render()
+    return snapshot, DisplayPyramid(snapshot.render_display())
+
+
+@timed("save")
+def write_image(path, snapshot, options):
+    return save_image(path, snapshot.render(quality=BEST), options)
 
 class ImageEditorApp:
-    def __init__(self, root):
+    def __init__(self, root, thumbnail_cache_path=DEFAULT_CACHE_PATH):
         self.root = root
         self.root.title("Image Crop & Resize Editor with Extras")
+        self.thumbnail_cache_path = thumbnail_cache_path
 
         # Images
-        self.original_img = None       # PIL original
-        self.cv_img = None             # Current OpenCV BGR image
-        self.cropped_img = None        # Cropped img (BGR)
-        self.display_img = None        # PIL display image (after all ops)
-        self.tk_img = None
+        self.pipeline = None           # Lazy edit pipeline behind cv_img
+        self.resize_base_size = None   # (w, h) the resize slider percentage refers to
+        self.pending_resize = None     # (w, h) previewed while the slider is dragged
 
         # Crop coords
         self.start_x = self.start_y = 0
+        self.selecting = False
         self.rect_id = None
         self.crop_coords = None
 
-        # Undo/Redo stacks store copies of cv_img
-        self.undo_stack = []
-        self.redo_stack = []
+        # Multi-region mode: each selection is added to a list exported in one pass
+        self.region_mode = False
+        self.regions = []   # (x0, y0, x1, y1) in image pixels
+        self.region_items = []
+
+        # Undo/Redo history stores edit operations plus occasional keyframes
+        self.history = None
+
+        # Open images; the fields above belong to the active document
+        self.session = Session(SESSION_CACHE_MB)
+        self.document = None
+
+        # Encoder settings per format, edited in the save options window
+        self.save_options = copy.deepcopy(ENCODER_DEFAULTS)
 
         # Flags for optional features
         self.is_grayscale = False
         self.is_flipped = False
 
+        # Timing overlay: per-stage ms since the last refresh, plus memory
+        self.hud_visible = False
+        self.hud_after = None
+        self.hud_stats = {}
+
         self.setup_ui()
         self.setup_bindings()
 
+        # Heavy OpenCV work runs on worker threads; results come back through root.after
+        self.jobs = JobRunner(self.root, on_progress=self.show_progress)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        if os.environ.get(HUD_ENV):
+            self.toggle_hud()
+
+    @property
+    def cv_img(self):
+        # Current OpenCV BGR image, only evaluated when something reads it
+        if self.pipeline is None:
+            return None
+        return self.pipeline.render()
+
     def setup_ui(self):
         # Buttons frame
         btn_frame = tk.Frame(self.root)
         btn_frame.pack(fill=tk.X, padx=5, pady=5)
 
+        # Status bar showing running background jobs
+        status_frame = tk.Frame(self.root)
+        status_frame.pack(side=tk.BOTTOM, fill=tk.X, padx=5, pady=2)
+        self.progress_bar = ttk.Progressbar(status_frame, mode="indeterminate", length=150)
+        self.progress_bar.pack(side=tk.RIGHT)
+        self.status_label = tk.Label(status_frame, text="", anchor="w")
+        self.status_label.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self.progress_bar_running = False
+
+        # Filmstrip of the open images; click one to switch to it
+        self.filmstrip = tk.Canvas(self.root, height=THUMB_SIZE + 24, bg="#333333", highlightthickness=0)
+        self.filmstrip.pack(side=tk.BOTTOM, fill=tk.X)
+        self.filmstrip_images = []
+
         tk.Button(btn_frame, text="Load Image", command=self.load_image).pack(side=tk.LEFT, padx=5)
+        tk.Button(btn_frame, text="Close Image", command=self.close_document).pack(side=tk.LEFT, padx=5)
         tk.Button(btn_frame, text="Crop", command=self.crop_image).pack(side=tk.LEFT, padx=5)
         tk.Button(btn_frame, text="Undo", command=self.undo).pack(side=tk.LEFT, padx=5)
         tk.Button(btn_frame, text="Redo", command=self.redo).pack(side=tk.LEFT, padx=5)
         tk.Button(btn_frame, text="Save Image", command=self.save_image).pack(side=tk.LEFT, padx=5)
+        tk.Button(btn_frame, text="Save Options", command=self.open_save_options).pack(side=tk.LEFT, padx=5)
         tk.Button(btn_frame, text="Toggle Grayscale (G)", command=self.toggle_grayscale).pack(side=tk.LEFT, padx=5)
         tk.Button(btn_frame, text="Flip Horizontal (F)", command=self.flip_horizontal).pack(side=tk.LEFT, padx=5)
+        tk.Button(btn_frame, text="Adjust (A)", command=self.open_adjustments).pack(side=tk.LEFT, padx=5)
+        self.region_button = tk.Button(btn_frame, text="Regions (R)", command=self.toggle_region_mode)
+        self.region_button.pack(side=tk.LEFT, padx=5)
+        tk.Button(btn_frame, text="Export Regions", command=self.export_regions).pack(side=tk.LEFT, padx=5)
 
         # Resize slider label
         self.slider_label = tk.Label(btn_frame, text="Resize: 100%")
@@ -55,88 +177,357 @@ class ImageEditorApp:
         self.resize_slider.set(100)
         self.resize_slider.pack(side=tk.LEFT, padx=5)
 
-        # Main canvas for image display
-        self.canvas = tk.Canvas(self.root, cursor="cross")
+        # While dragging only a cheap preview is drawn; the real resize runs on release
+        self.resize_debounce = Debouncer(self.root, self.show_resize_preview)
+        self.resize_slider.bind("<ButtonRelease-1>", lambda e: self.root.after_idle(self.commit_resize))
+        self.resize_slider.bind("<KeyRelease>", lambda e: self.root.after_idle(self.commit_resize))
+
+        # Main canvas for image display; large images are shown through a tiled viewport
+        self.canvas = tk.Canvas(self.root, cursor="cross", width=900, height=600)
         self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         self.canvas.bind("<ButtonPress-1>", self.on_button_press)
         self.canvas.bind("<B1-Motion>", self.on_move_press)
         self.canvas.bind("<ButtonRelease-1>", self.on_button_release)
+        self.viewport = CanvasViewport(self.canvas)
+
+        # Live crop preview renders at most once per frame however fast the mouse moves
+        self.preview_throttle = FrameThrottle(self.root, self.show_preview)
+
+        # Zoom with the mouse wheel, pan by dragging with the right button
+        self.canvas.bind("<MouseWheel>", lambda e: self.zoom_view(1.25 if e.delta > 0 else 0.8, e))
+        self.canvas.bind("<Button-4>", lambda e: self.zoom_view(1.25, e))
+        self.canvas.bind("<Button-5>", lambda e: self.zoom_view(0.8, e))
+        self.canvas.bind("<ButtonPress-3>", self.on_pan_press)
+        self.canvas.bind("<B3-Motion>", self.on_pan_move)
+        self.canvas.bind("<Configure>", lambda e: self.redraw_view())
 
         # Preview canvas for cropped/resized image
         self.preview_canvas = tk.Canvas(self.root, width=300, height=300, bg="gray")
-        self.preview_canvas.pack(side=tk.RIGHT, padx=5, pady=5)
+        self.preview_canvas.pack(side=tk.RIGHT, anchor="n", padx=5, pady=5)
+
+        # Folder browser beside the preview; thumbnails persist in an on-disk cache
+        self.browser = ThumbnailBrowser(self.root, ThumbnailCache(self.thumbnail_cache_path), self.open_path)
+        self.browser.frame.pack(side=tk.RIGHT, fill=tk.Y, padx=5, pady=5)
 
     def setup_bindings(self):
         self.root.bind("<Control-o>", lambda e: self.load_image())
         self.root.bind("<Control-s>", lambda e: self.save_image())
+        self.root.bind("<Control-w>", lambda e: self.close_document())
+        self.root.bind("<Control-Tab>", lambda e: self.cycle_document(1))
+        self.root.bind("<Control-Shift-Tab>", lambda e: self.cycle_document(-1))
         self.root.bind("<Control-z>", lambda e: self.undo())
         self.root.bind("<Control-y>", lambda e: self.redo())
         self.root.bind("g", lambda e: self.toggle_grayscale())
         self.root.bind("G", lambda e: self.toggle_grayscale())
         self.root.bind("f", lambda e: self.flip_horizontal())
         self.root.bind("F", lambda e: self.flip_horizontal())
+        self.root.bind("a", lambda e: self.open_adjustments())
+        self.root.bind("r", lambda e: self.toggle_region_mode())
+        self.root.bind("R", lambda e: self.toggle_region_mode())
+        self.root.bind("<BackSpace>", lambda e: self.remove_last_region())
+        self.root.bind("A", lambda e: self.open_adjustments())
+        self.root.bind("0", lambda e: self.fit_view())
+        self.root.bind("h", lambda e: self.toggle_hud())
+        self.root.bind("H", lambda e: self.toggle_hud())
 
     def load_image(self):
         filetypes = [("Image files", "*.jpg *.jpeg *.png *.bmp *.tiff"), ("All files", "*.*")]
         path = filedialog.askopenfilename(title="Select an image", filetypes=filetypes)
-        if not path:
+        if path:
+            self.open_path(path)
+
+    def open_path(self, path):
+        # Images that are already open are switched to, never decoded again
+        doc = self.session.find(path)
+        if doc is not None:
+            self.switch_document(doc)
             return
-        self.original_img = Image.open(path).convert("RGB")
-        self.cv_img = cv2.cvtColor(np.array(self.original_img), cv2.COLOR_RGB2BGR)
-        self.reset_flags()
-        self.clear_undo_redo()
-        self.display_image(self.original_img)
+        self.jobs.submit("load-preview", decode_preview, path, on_done=self.on_preview_loaded, label="Loading preview")
+        self.jobs.submit("load", decode_image, path, on_done=lambda result: self.on_image_loaded(result, path),
+                         on_error=self.on_job_error, label="Loading")
+
+    def on_preview_loaded(self, result):
+        # Show the reduced decode scaled to the full size until the real image arrives
+        if result is None or not self.jobs.busy("load"):
+            return
+        (width, height), pyramid = result
+        self.viewport.show_pyramid(pyramid, fit=False)
+        self.viewport.show_scaled(width, height)
+
+    def on_image_loaded(self, result, path=None):
+        pipeline, pyramid = result
+        self.jobs.cancel("load-preview")
+        doc = Document(path, pipeline, EditHistory(pipeline.source, budget_mb=HISTORY_BUDGET_MB))
+        doc.set_pyramid(pyramid)
+        self.stash_document()
+        self.session.add(doc)
+        self.show_document(doc)
+
+    def stash_document(self):
+        # Store the active image's editing state in its document
+        doc = self.document
+        if doc is None:
+            return
+        self.commit_resize()
+        doc.pipeline, doc.history = self.pipeline, self.history
+        doc.is_grayscale, doc.is_flipped = self.is_grayscale, self.is_flipped
+        doc.resize_enabled = self.resize_base_size is not None
+        doc.view = (self.viewport.zoom, self.viewport.origin)
+        if self.jobs.busy("render"):
+            doc.pyramid = None  # out of date; rendered again when the document is shown
+        self.jobs.cancel("render")
+
+    @timed("switch")
+    def show_document(self, doc):
+        self.document = doc
+        self.session.activate(doc)
+        self.pipeline, self.history = doc.pipeline, doc.history
+        self.is_grayscale, self.is_flipped = doc.is_grayscale, doc.is_flipped
 
         self.crop_coords = None
         self.clear_rectangle()
+        self.clear_regions()
         self.clear_preview()
-        self.resize_slider.config(state=tk.DISABLED)
+        self.pending_resize = None
+        self.resize_debounce.cancel()
+        self.resize_base_size = self.pipeline.size() if doc.resize_enabled else None
+        self.resize_slider.config(state=tk.NORMAL if doc.resize_enabled else tk.DISABLED)
         self.resize_slider.set(100)
         self.slider_label.config(text="Resize: 100%")
 
+        if doc.pyramid is not None and doc.view is not None:
+            self.viewport.zoom, self.viewport.origin = doc.view
+            self.viewport.show_pyramid(doc.pyramid, fit=False)
+        elif doc.pyramid is not None:
+            self.display_image(doc.pyramid)
+        else:
+            # Evicted: show the thumbnail scaled up until the pipeline is rendered again
+            self.viewport.show_pyramid(DisplayPyramid(doc.thumbnail), fit=False)
+            self.viewport.show_scaled(*self.pipeline.size())
+            self.refresh_display()
+        self.session.enforce(doc)
+        self.draw_filmstrip()
+
+    def switch_document(self, doc):
+        if doc is self.document:
+            return
+        self.stash_document()
+        self.show_document(doc)
+
+    def cycle_document(self, step):
+        docs = self.session.documents
+        if self.document is None or len(docs) < 2:
+            return
+        self.switch_document(docs[(docs.index(self.document) + step) % len(docs)])
+
+    def close_document(self):
+        doc = self.document
+        if doc is None:
+            return
+        docs = self.session.documents
+        index = docs.index(doc)
+        self.jobs.cancel("render")
+        self.commit_resize()
+        self.session.remove(doc)
+        self.document = None
+        if docs:
+            self.show_document(docs[min(index, len(docs) - 1)])
+            return
+
+        self.pipeline = self.history = None
+        self.reset_flags()
+        self.crop_coords = None
+        self.clear_rectangle()
+        self.clear_regions()
+        self.clear_preview()
+        self.resize_base_size = self.pending_resize = None
+        self.resize_debounce.cancel()
+        self.resize_slider.config(state=tk.DISABLED)
+        self.viewport.clear()
+        self.draw_filmstrip()
+
+    def draw_filmstrip(self):
+        self.filmstrip.delete("all")
+        self.filmstrip_images = []
+        for i, doc in enumerate(self.session.documents):
+            x = 6 + i * (THUMB_SIZE + 10)
+            pil_thumb = to_pil(doc.thumbnail)
+            pil_thumb.thumbnail((THUMB_SIZE, THUMB_SIZE))
+            tk_thumb = ImageTk.PhotoImage(pil_thumb)
+            self.filmstrip_images.append(tk_thumb)
+            tag = f"doc{i}"
+            if doc is self.document:
+                self.filmstrip.create_rectangle(x - 3, 3, x + THUMB_SIZE + 3, THUMB_SIZE + 9,
+                                                outline="#4da6ff", width=2, tags=tag)
+            self.filmstrip.create_image(x + THUMB_SIZE // 2, 6 + THUMB_SIZE // 2, image=tk_thumb, tags=tag)
+            self.filmstrip.create_text(x + THUMB_SIZE // 2, THUMB_SIZE + 16, text=doc.name[:14],
+                                       fill="white", font=("Arial", 8), tags=tag)
+            self.filmstrip.tag_bind(tag, "<Button-1>", lambda e, doc=doc: self.switch_document(doc))
+
     def reset_flags(self):
         self.is_grayscale = False
         self.is_flipped = False
 
-    def clear_undo_redo(self):
-        self.undo_stack.clear()
-        self.redo_stack.clear()
-
-    def display_image(self, pil_img):
-        self.display_img = pil_img
-        self.tk_img = ImageTk.PhotoImage(pil_img)
-        self.canvas.config(width=pil_img.width, height=pil_img.height)
-        self.canvas.create_image(0, 0, anchor="nw", image=self.tk_img)
-        self.canvas.image = self.tk_img
-
+    @timed("display")
+    def display_image(self, pyramid):
+        # Only the visible tiles of the pyramid become Tk images
+        self.viewport.show_pyramid(pyramid)
+        if self.document is not None:
+            self.document.set_pyramid(pyramid)
+            self.session.enforce(self.document)
+            self.draw_filmstrip()
+
+    def refresh_display(self, preview=False):
+        # Evaluate the pipeline and build the display pyramid on a worker thread;
+        # a newer refresh supersedes one that is still running
+        self.jobs.submit("render", render_display, self.pipeline.snapshot(),
+                         on_done=lambda result: self.on_display_rendered(result, preview),
+                         on_error=self.on_job_error, label="Rendering")
+
+    def on_display_rendered(self, result, preview):
+        snapshot, pyramid = result
+        self.pipeline.adopt(snapshot)
+        self.display_image(pyramid)
+        if preview:
+            self.show_whole_preview()
+
+    def show_progress(self, jobs):
+        if jobs:
+            self.status_label.config(text=", ".join(f"{label}... {elapsed:.1f}s" for label, elapsed in jobs))
+            if not self.progress_bar_running:
+                self.progress_bar.start(15)
+                self.progress_bar_running = True
+        else:
+            self.status_label.config(text="")
+            if self.progress_bar_running:
+                self.progress_bar.stop()
+                self.progress_bar_running = False
+
+    def on_job_error(self, error):
+        messagebox.showerror("Error", str(error))
+
+    def on_close(self):
+        self.jobs.shutdown()
+        self.browser.close()
+        self.session.close()
+        if self.hud_after is not None:
+            self.root.after_cancel(self.hud_after)
+        self.root.destroy()
+
+    def toggle_hud(self):
+        self.hud_visible = not self.hud_visible
+        if self.hud_visible:
+            instruments.take_recent()  # start from a clean interval
+            self.hud_stats = {}
+            self.update_hud()
+        else:
+            if self.hud_after is not None:
+                self.root.after_cancel(self.hud_after)
+                self.hud_after = None
+            self.canvas.delete("hud")
+
+    def update_hud(self):
+        # Stages keep their last reading until they run again
+        self.hud_stats.update(instruments.take_recent())
+        lines = [f"{name:<20}{ms:8.1f} ms" + (f" x{calls}" if calls > 1 else "")
+                 for name, (ms, calls) in sorted(self.hud_stats.items())]
+        preview = self.preview_throttle.stats()
+        if preview["runs"]:
+            lines.append(f"{'preview latency':<20}{preview['mean_latency_ms']:8.1f} ms"
+                         f" (max {preview['max_latency_ms']:.1f}, {preview['runs']}/{preview['calls']} moves)")
+        rss = memory_mb()
+        if rss is not None:
+            lines.append(f"{'memory (RSS)':<20}{rss:8.0f} MB")
+        if self.history is not None:
+            lines.append(f"{'undo keyframes':<20}{self.history.memory_bytes() / 2 ** 20:8.0f} MB")
+        if self.session.documents:
+            lines.append(f"{'open images':<20}{self.session.memory_bytes() / 2 ** 20:8.0f} MB"
+                         f" ({len(self.session.lru)}/{len(self.session.documents)} in memory)")
+
+        self.canvas.delete("hud")
+        text = self.canvas.create_text(8, 8, anchor="nw", text="\n".join(lines) or "no timings yet",
+                                       font=("Courier", 9), fill="#7CFC00", tags="hud")
+        bbox = self.canvas.bbox(text)
+        if bbox:
+            self.canvas.create_rectangle(bbox[0] - 4, bbox[1] - 4, bbox[2] + 4, bbox[3] + 4,
+                                         fill="black", outline="", tags="hud")
+            self.canvas.tag_raise(text)
+        self.hud_after = self.root.after(HUD_MS, self.update_hud)
+
+    def redraw_view(self):
+        self.viewport.redraw()
+        self.draw_rectangle()
+        self.draw_regions()
+
+    def fit_view(self):
+        if self.viewport.pyramid is not None:
+            self.viewport.fit()
+            self.draw_rectangle()
+            self.draw_regions()
+
+    def zoom_view(self, factor, event):
+        self.viewport.zoom_at(factor, event.x, event.y)
+        self.draw_rectangle()
+        self.draw_regions()
+
+    def on_pan_press(self, event):
+        self.pan_x, self.pan_y = event.x, event.y
+
+    def on_pan_move(self, event):
+        self.viewport.pan(event.x - self.pan_x, event.y - self.pan_y)
+        self.pan_x, self.pan_y = event.x, event.y
+        self.draw_rectangle()
+        self.draw_regions()
+
+    # Selection coordinates are kept in full-resolution image pixels
     def on_button_press(self, event):
-        if self.cv_img is None:
+        # The displayed image is stale while a render is pending, so no selection then
+        self.selecting = self.pipeline is not None and not self.jobs.busy("render") and not self.jobs.busy("load")
+        if not self.selecting:
             return
-        self.start_x, self.start_y = event.x, event.y
+        self.start_x, self.start_y = self.viewport.canvas_to_image(event.x, event.y)
+        self.crop_coords = None
         self.clear_rectangle()
 
     def on_move_press(self, event):
-        if self.cv_img is None:
+        if not self.selecting:
             return
-        cur_x, cur_y = event.x, event.y
-        self.clear_rectangle()
-        self.rect_id = self.canvas.create_rectangle(self.start_x, self.start_y, cur_x, cur_y, outline="red", width=2)
-        self.show_preview(self.start_x, self.start_y, cur_x, cur_y)
+        cur_x, cur_y = self.viewport.canvas_to_image(event.x, event.y)
+        self.crop_coords = (self.start_x, self.start_y, cur_x, cur_y)
+        self.draw_rectangle()
+        self.preview_throttle(self.start_x, self.start_y, cur_x, cur_y)
 
     def on_button_release(self, event):
-        if self.cv_img is None:
+        if not self.selecting:
+            return
+        cur_x, cur_y = self.viewport.canvas_to_image(event.x, event.y)
+        self.crop_coords = (self.start_x, self.start_y, cur_x, cur_y)
+        self.selecting = False
+        self.preview_throttle.flush()
+        if self.region_mode:
+            self.add_region()
+
+    def draw_rectangle(self):
+        if self.crop_coords is None:
             return
-        self.crop_coords = (self.start_x, self.start_y, event.x, event.y)
+        x1, y1, x2, y2 = self.crop_coords
+        coords = (*self.viewport.image_to_canvas(x1, y1), *self.viewport.image_to_canvas(x2, y2))
+        if self.rect_id:
+            self.canvas.coords(self.rect_id, *coords)
+            self.canvas.tag_raise(self.rect_id)
+        else:
+            self.rect_id = self.canvas.create_rectangle(*coords, outline="red", width=2)
 
     def clear_rectangle(self):
         if self.rect_id:
             self.canvas.delete(self.rect_id)
             self.rect_id = None
 
+    @timed("preview")
     def show_preview(self, x1, y1, x2, y2):
-        if self.cv_img is None:
+        if self.pipeline is None:
             return
-        h, w = self.cv_img.shape[:2]
+        w, h = self.pipeline.size()
 
         # Clamp coords inside image bounds
         x1, y1 = max(0, min(x1, w-1)), max(0, min(y1, h-1))
@@ -148,30 +539,37 @@ class ImageEditorApp:
             self.clear_preview()
             return
 
-        crop_img = self.cv_img[ymin:ymax, xmin:xmax]
-        if crop_img.size == 0:
-            self.clear_preview()
-            return
-
-        pil_crop = Image.fromarray(cv2.cvtColor(crop_img, cv2.COLOR_BGR2RGB))
+        # Read the selection from the display pyramid level closest to the preview size
+        region = self.viewport.pyramid.region((xmin, ymin, xmax, ymax), 300)
+        pil_crop = to_pil(region)
         pil_crop.thumbnail((300, 300))
-        self.preview_tk_img = ImageTk.PhotoImage(pil_crop)
+        self.show_in_preview(pil_crop)
+
+    def show_whole_preview(self):
+        pyramid = self.viewport.pyramid
+        pil_preview = to_pil(pyramid.region((0, 0, pyramid.width, pyramid.height), 300))
+        pil_preview.thumbnail((300, 300))
+        self.show_in_preview(pil_preview)
 
+    def show_in_preview(self, pil_img):
+        with instruments.stage("preview.PhotoImage"):
+            self.preview_tk_img = ImageTk.PhotoImage(pil_img)
         self.preview_canvas.delete("all")
         self.preview_canvas.create_image(150, 150, image=self.preview_tk_img, anchor="center")
         self.preview_canvas.image = self.preview_tk_img
 
     def clear_preview(self):
+        self.preview_throttle.cancel()
         self.preview_canvas.delete("all")
         self.preview_canvas.image = None
 
     def crop_image(self):
-        if self.cv_img is None or self.crop_coords is None:
+        if self.pipeline is None or self.crop_coords is None:
             messagebox.showwarning("Warning", "No crop area selected!")
             return
 
         x1, y1, x2, y2 = self.crop_coords
-        h, w = self.cv_img.shape[:2]
+        w, h = self.pipeline.size()
 
         x1, y1 = max(0, min(x1, w-1)), max(0, min(y1, h-1))
         x2, y2 = max(0, min(x2, w-1)), max(0, min(y2, h-1))
@@ -182,147 +580,357 @@ class ImageEditorApp:
             messagebox.showwarning("Warning", "Crop area too small!")
             return
 
-        # Push current state to undo stack
-        self.push_undo()
-
-        cropped = self.cv_img[ymin:ymax, xmin:xmax]
-        self.cropped_img = cropped.copy()
-        self.cv_img = cropped
-
-        pil_img = Image.fromarray(cv2.cvtColor(cropped, cv2.COLOR_BGR2RGB))
-        self.display_image(pil_img)
-
-        self.crop_coords = None
-        self.clear_rectangle()
-        self.clear_preview()
-
-        self.resize_slider.config(state=tk.NORMAL)
-        self.resize_slider.set(100)
-        self.slider_label.config(text="Resize: 100%")
+        self.apply_edit(("crop", (xmin, ymin, xmax, ymax)))
 
+    @timed("resize.slider")
     def resize_image(self, val):
-        if self.cropped_img is None:
+        if self.resize_base_size is None:
             return
         scale_percent = int(val)
         self.slider_label.config(text=f"Resize: {scale_percent}%")
 
-        width = int(self.cropped_img.shape[1] * scale_percent / 100)
-        height = int(self.cropped_img.shape[0] * scale_percent / 100)
+        width = int(self.resize_base_size[0] * scale_percent / 100)
+        height = int(self.resize_base_size[1] * scale_percent / 100)
 
         if width < 1 or height < 1:
             return
 
-        resized = cv2.resize(self.cropped_img, (width, height), interpolation=cv2.INTER_AREA)
-        self.cv_img = resized
+        size = (width, height)
+        if size == self.pipeline.size():
+            if self.pending_resize is not None:
+                self.pending_resize = None
+                self.resize_debounce.cancel()
+                self.fit_view()
+            return
+        self.pending_resize = size
+        self.resize_debounce()
 
-        pil_img = Image.fromarray(cv2.cvtColor(resized, cv2.COLOR_BGR2RGB))
-        self.display_image(pil_img)
+    @timed("resize.preview")
+    def show_resize_preview(self):
+        # Drawn from the existing display pyramid, so no full-resolution resize is needed
+        if self.pending_resize is None:
+            return
+        self.viewport.show_scaled(*self.pending_resize)
+        self.show_whole_preview()
 
-        pil_preview = pil_img.copy()
-        pil_preview.thumbnail((300, 300))
-        self.preview_tk_img = ImageTk.PhotoImage(pil_preview)
-        self.preview_canvas.delete("all")
-        self.preview_canvas.create_image(150, 150, image=self.preview_tk_img, anchor="center")
-        self.preview_canvas.image = self.preview_tk_img
+    @timed("resize.commit")
+    def commit_resize(self):
+        if self.pending_resize is None:
+            return
+        self.resize_debounce.cancel()
+        op = ("resize", self.pending_resize)
+        self.pending_resize = None
+        self.scale_regions(self.pipeline.size(), op[1])
+
+        # Slider drags refine a single resize node instead of filling the history
+        top = self.history.top_op()
+        if top is not None and top[0] == "resize":
+            # After undo/redo or a restore the pipeline may start from that resize's own
+            # keyframe, so it is rebuilt from the state before it
+            source, ops = self.history.checkpoint(self.history.cursor - 1)
+            self.pipeline.reset(source, ops + [op])
+            self.history.replace_top(op, self.color_render)
+        else:
+            self.pipeline.push(op)
+            self.push_undo(op)
+
+        self.refresh_display(preview=True)
 
     def save_image(self):
-        if self.cv_img is None:
+        if self.pipeline is None:
             messagebox.showwarning("Warning", "No image to save!")
             return
+        self.commit_resize()
 
         file = filedialog.asksaveasfilename(defaultextension=".png",
                                             filetypes=[("PNG files", "*.png"),
                                                        ("JPEG files", "*.jpg;*.jpeg"),
+                                                       ("WebP files", "*.webp"),
                                                        ("BMP files", "*.bmp")])
         if not file:
             return
+        try:
+            fmt = format_for(file)
+        except ValueError as error:
+            messagebox.showwarning("Warning", str(error))
+            return
 
-        cv2.imwrite(file, self.cv_img)
-        messagebox.showinfo("Saved", f"Image saved to {file}")
+        # Each target file gets its own job, so several saves can be queued while editing
+        self.jobs.submit(f"save:{file}", write_image, file, self.pipeline.snapshot(),
+                         dict(self.save_options[fmt]), on_done=self.on_image_saved,
+                         on_error=self.on_job_error, label=f"Saving {os.path.basename(file)}")
+
+    def on_image_saved(self, report):
+        messagebox.showinfo("Saved", f"Image saved to {report['path']}\n"
+                                     f"{report['bytes'] / 1024:.0f} KB, encoded in {report['encode_ms']:.0f} ms, "
+                                     f"written in {report['write_ms']:.0f} ms")
+
+    def open_save_options(self):
+        window = tk.Toplevel(self.root)
+        window.title("Save Options")
+        png = self.save_options["png"]
+        jpeg = self.save_options["jpeg"]
+        webp = self.save_options["webp"]
+
+        png_level = tk.IntVar(value=png["compression"])
+        jpeg_quality = tk.IntVar(value=jpeg["quality"])
+        jpeg_progressive = tk.BooleanVar(value=jpeg["progressive"])
+        jpeg_optimize = tk.BooleanVar(value=jpeg["optimize"])
+        webp_quality = tk.IntVar(value=webp["quality"])
+
+        tk.Scale(window, label="PNG compression (0 fast - 9 small)", from_=0, to=9, orient=tk.HORIZONTAL,
+                 variable=png_level, length=250).pack(fill=tk.X, padx=5)
+        tk.Scale(window, label="JPEG quality", from_=1, to=100, orient=tk.HORIZONTAL,
+                 variable=jpeg_quality, length=250).pack(fill=tk.X, padx=5)
+        tk.Checkbutton(window, text="JPEG progressive", variable=jpeg_progressive).pack(anchor="w", padx=5)
+        tk.Checkbutton(window, text="JPEG optimize", variable=jpeg_optimize).pack(anchor="w", padx=5)
+        tk.Scale(window, label="WebP quality (101 = lossless)", from_=1, to=101, orient=tk.HORIZONTAL,
+                 variable=webp_quality, length=250).pack(fill=tk.X, padx=5)
+
+        def apply():
+            png["compression"] = png_level.get()
+            jpeg.update(quality=jpeg_quality.get(), progressive=jpeg_progressive.get(),
+                        optimize=jpeg_optimize.get())
+            webp["quality"] = webp_quality.get()
+            window.destroy()
+
+        tk.Button(window, text="OK", command=apply).pack(pady=5)
+
+    def apply_edit(self, op):
+        # Edits only add a node to the pipeline; it is evaluated once for display
+        self.commit_resize()
+        self.pipeline.push(op)
+        self.push_undo(op)
+        self.refresh_after_edit()
+
+    def refresh_after_edit(self):
+        self.refresh_display()
+
+        # The resize slider now scales the current state
+        self.resize_base_size = self.pipeline.size()
+        self.resize_slider.config(state=tk.NORMAL)
+        self.resize_slider.set(100)
+        self.slider_label.config(text="Resize: 100%")
+
+        self.crop_coords = None
+        self.clear_rectangle()
+        self.clear_regions()
+        self.clear_preview()
 
     # Undo/Redo management
-    def push_undo(self):
-        if self.cv_img is not None:
-            self.undo_stack.append(self.cv_img.copy())
-            # Clear redo stack on new action
-            self.redo_stack.clear()
+    def push_undo(self, op):
+        # Record the operation that produced the current pipeline state (clears redo)
+        if self.history is not None:
+            self.history.push(op, self.color_render)
+
+    def color_render(self):
+        # Keyframes hold the edited color image; grayscale is only a view of it. Resized
+        # states are not kept, so every quality mode still resamples the original pixels
+        # whatever the undo path (the fused pipeline replays them in one pass anyway).
+        if self.pipeline.resamples():
+            return None
+        return self.pipeline.render(gray=False)
 
     def undo(self):
-        if not self.undo_stack:
+        if self.history is None or not self.history.can_undo():
             messagebox.showinfo("Undo", "Nothing to undo")
             return
-        self.redo_stack.append(self.cv_img.copy())
-        self.cv_img = self.undo_stack.pop()
+        self.commit_resize()
+        self.pipeline.reset(*self.history.undo())
         self.update_after_undo_redo()
 
     def redo(self):
-        if not self.redo_stack:
+        if self.history is None or not self.history.can_redo():
             messagebox.showinfo("Redo", "Nothing to redo")
             return
-        self.undo_stack.append(self.cv_img.copy())
-        self.cv_img = self.redo_stack.pop()
+        self.commit_resize()
+        self.pipeline.reset(*self.history.redo())
         self.update_after_undo_redo()
 
     def update_after_undo_redo(self):
-        pil_img = Image.fromarray(cv2.cvtColor(self.cv_img, cv2.COLOR_BGR2RGB))
-        self.display_image(pil_img)
-
-        # Reset cropped_img to current state for resize slider
-        self.cropped_img = self.cv_img.copy()
-        self.resize_slider.config(state=tk.NORMAL)
-        self.resize_slider.set(100)
-        self.slider_label.config(text="Resize: 100%")
-
-        self.clear_rectangle()
-        self.clear_preview()
-        self.reset_flags()  # Reset grayscale/flip flags
+        self.refresh_after_edit()
+        self.is_flipped = False  # grayscale is a view mode and stays on
 
     # Additional processing features
     def toggle_grayscale(self):
-        if self.cv_img is None:
+        # Grayscale is a view mode, not an edit: the color source and the undo history
+        # are untouched. The pyramid of the mode being left is kept, so toggling back
+        # without editing in between is only a redraw.
+        if self.pipeline is None:
             return
-
-        self.push_undo()
-        if not self.is_grayscale:
-            gray = cv2.cvtColor(self.cv_img, cv2.COLOR_BGR2GRAY)
-            self.cv_img = cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
-            self.is_grayscale = True
+        self.commit_resize()
+        doc = self.document
+        shown = None
+        if doc.pyramid is not None and not self.jobs.busy("render"):
+            shown = (self.is_grayscale, self.pipeline.source, list(self.pipeline.ops), doc.pyramid)
+        other, doc.other_view = doc.other_view, shown
+
+        self.is_grayscale = not self.is_grayscale
+        self.pipeline.set_gray(self.is_grayscale)
+        if (other is not None and other[0] == self.is_grayscale and other[1] is self.pipeline.source
+                and other[2] == self.pipeline.ops):
+            self.jobs.cancel("render")
+            self.viewport.show_pyramid(other[3], fit=False)
+            doc.set_pyramid(other[3])
+            self.draw_filmstrip()
         else:
-            # Revert to original or last non-gray
-            # For simplicity, just reload last undo (if available)
-            if self.undo_stack:
-                self.cv_img = self.undo_stack.pop()
-                self.is_grayscale = False
-            else:
-                self.is_grayscale = False
+            self.refresh_display()
+        self.clear_preview()
 
-        pil_img = Image.fromarray(cv2.cvtColor(self.cv_img, cv2.COLOR_BGR2RGB))
-        self.display_image(pil_img)
-        self.cropped_img = self.cv_img.copy()
-        self.resize_slider.config(state=tk.NORMAL)
-        self.resize_slider.set(100)
-        self.slider_label.config(text="Resize: 100%")
+    def open_adjustments(self):
+        # While the sliders move, the adjustments are previewed on the reduced display
+        # level that fills the canvas; the full-resolution image is only processed when
+        # they are applied, as one edit whose stack is a single lookup table
+        if self.pipeline is None:
+            return
+        self.commit_resize()
+        base = self.viewport.pyramid
+        window = tk.Toplevel(self.root)
+        window.title("Adjustments")
+
+        brightness = tk.IntVar(value=0)
+        contrast = tk.IntVar(value=0)
+        gamma = tk.DoubleVar(value=1.0)
+        black = tk.IntVar(value=0)
+        white = tk.IntVar(value=255)
+        curve = tk.StringVar(value="")
+
+        def stack():
+            adjustments = [("brightness", brightness.get()), ("contrast", contrast.get()),
+                           ("gamma", gamma.get())]
+            if (black.get(), white.get()) != (0, 255):
+                adjustments.append(("levels", black.get(), white.get()))
+            try:
+                points = tuple(tuple(int(v) for v in point.split(":")) for point in curve.get().split(",")
+                               if point.strip())
+            except ValueError:
+                points = ()
+            if len(points) >= 2 and all(len(point) == 2 for point in points):
+                adjustments.append(("curves", points))
+            return tuple(adj for adj in adjustments if not filters.is_identity([adj]))
+
+        preview = FrameThrottle(self.root, lambda: self.show_adjust_preview(base, stack()))
+        for label, var, low, high, step in [("Brightness", brightness, -100, 100, 1),
+                                            ("Contrast", contrast, -100, 100, 1),
+                                            ("Gamma", gamma, 0.2, 3.0, 0.05),
+                                            ("Levels black", black, 0, 254, 1),
+                                            ("Levels white", white, 1, 255, 1)]:
+            tk.Scale(window, label=label, from_=low, to=high, resolution=step, orient=tk.HORIZONTAL,
+                     variable=var, length=250, command=lambda v: preview()).pack(fill=tk.X, padx=5)
+        tk.Label(window, text="Curves (in:out, ...), e.g. 0:0,128:150,255:255", anchor="w").pack(fill=tk.X, padx=5)
+        entry = tk.Entry(window, textvariable=curve)
+        entry.pack(fill=tk.X, padx=5)
+        entry.bind("<KeyRelease>", lambda e: preview())
+
+        def close():
+            preview.cancel()
+            window.destroy()
+
+        def cancel():
+            close()
+            self.viewport.show_pyramid(base)
+            self.clear_preview()
+
+        def apply():
+            adjustments = stack()
+            close()
+            if adjustments:
+                self.apply_edit(("adjust", adjustments))
+            else:
+                cancel()
+
+        buttons = tk.Frame(window)
+        buttons.pack(pady=5)
+        tk.Button(buttons, text="Apply", command=apply).pack(side=tk.LEFT, padx=5)
+        tk.Button(buttons, text="Cancel", command=cancel).pack(side=tk.LEFT, padx=5)
+        window.protocol("WM_DELETE_WINDOW", cancel)
+
+    @timed("adjust.preview")
+    def show_adjust_preview(self, base, adjustments):
+        # Only the tiles in view go through the table; the pyramid keeps the full-res
+        # size, so selections and regions still map to image pixels
+        pyramid = base.adjusted(filters.build_lut(adjustments)) if adjustments else base
+        self.viewport.show_pyramid(pyramid, fit=False)
+        self.show_whole_preview()
+
+    # Multi-region export
+    def toggle_region_mode(self):
+        self.region_mode = not self.region_mode
+        self.region_button.config(relief=tk.SUNKEN if self.region_mode else tk.RAISED)
+        if not self.region_mode:
+            self.clear_regions()
+
+    def add_region(self):
+        # The finished selection joins the list instead of waiting for Crop
+        w, h = self.pipeline.size()
+        x1, y1, x2, y2 = self.crop_coords
+        rect = (min(x1, x2), min(y1, y2), min(max(x1, x2), w), min(max(y1, y2), h))
+        self.crop_coords = None
         self.clear_rectangle()
-        self.clear_preview()
+        if rect[2] - rect[0] < 10 or rect[3] - rect[1] < 10:
+            return
+        self.regions.append(rect)
+        self.draw_regions()
+
+    def remove_last_region(self):
+        if self.regions:
+            self.regions.pop()
+            self.draw_regions()
+
+    def draw_regions(self):
+        for item in self.region_items:
+            self.canvas.delete(item)
+        self.region_items = []
+        for i, (x1, y1, x2, y2) in enumerate(self.regions):
+            left, top = self.viewport.image_to_canvas(x1, y1)
+            right, bottom = self.viewport.image_to_canvas(x2, y2)
+            self.region_items.append(self.canvas.create_rectangle(left, top, right, bottom,
+                                                                  outline="#4da6ff", width=2))
+            self.region_items.append(self.canvas.create_text(left + 4, top + 4, anchor="nw", text=str(i + 1),
+                                                             fill="#4da6ff", font=("Arial", 10, "bold")))
+
+    def clear_regions(self):
+        self.regions = []
+        self.draw_regions()
+
+    def scale_regions(self, old_size, new_size):
+        # Marked regions follow the image through a resize
+        sx, sy = new_size[0] / old_size[0], new_size[1] / old_size[1]
+        self.regions = [(round(x1 * sx), round(y1 * sy), min(round(x2 * sx), new_size[0]),
+                         min(round(y2 * sy), new_size[1])) for x1, y1, x2, y2 in self.regions]
+        self.draw_regions()
+
+    def export_regions(self):
+        # All regions are cut from one render of the current image and encoded in
+        # parallel on a worker; the edit history and the display are not touched
+        if self.pipeline is not None:
+            self.commit_resize()
+        if self.pipeline is None or not self.regions:
+            messagebox.showwarning("Warning", "No regions selected! Press R and drag to add some.")
+            return
+        out_dir = filedialog.askdirectory(title="Export regions to")
+        if not out_dir:
+            return
+        stem = os.path.splitext(self.document.name)[0]
+        fmt = format_for(stem + REGION_EXT)
+        self.jobs.submit(f"export:{out_dir}", region_export.export_regions, self.pipeline.snapshot(),
+                         list(self.regions), out_dir, REGION_EXT, dict(self.save_options[fmt]), stem,
+                         self.document.path, on_done=self.on_regions_exported, on_error=self.on_job_error,
+                         label=f"Exporting {len(self.regions)} regions")
+
+    def on_regions_exported(self, report):
+        messagebox.showinfo("Exported", f"{report['count']} regions saved to {report['dir']}\n"
+                                        f"{report['bytes'] / 1024:.0f} KB in {report['seconds'] * 1000:.0f} ms, "
+                                        f"listed in {os.path.basename(report['manifest'])}")
 
     def flip_horizontal(self):
-        if self.cv_img is None:
+        if self.pipeline is None:
             return
 
-        self.push_undo()
-        self.cv_img = cv2.flip(self.cv_img, 1)
         self.is_flipped = not self.is_flipped
-
-        pil_img = Image.fromarray(cv2.cvtColor(self.cv_img, cv2.COLOR_BGR2RGB))
-        self.display_image(pil_img)
-        self.cropped_img = self.cv_img.copy()
-        self.resize_slider.config(state=tk.NORMAL)
-        self.resize_slider.set(100)
-        self.slider_label.config(text="Resize: 100%")
-        self.clear_rectangle()
-        self.clear_preview()
+        self.apply_edit(("flip",))
 
 if __name__ == "__main__":
     root = tk.Tk()
     app = ImageEditorApp(root)
-    root.mainloop()
+    root.mainloop()
\ No newline at end of file
@@ -0,0 +1,176 @@
+import glob
+import os
+import tempfile
+import time
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from image_ops import to_8bit
+
+# cv2 flags for decoding at 1/n of the size (libjpeg uses DCT scaling for these).
+# Full-size decodes keep gray images single-channel and 16-bit images 16-bit.
+REDUCED_FLAGS = {
+    1: cv2.IMREAD_ANYDEPTH | cv2.IMREAD_ANYCOLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+MEMMAP_BAND_ROWS = 256
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".webp")
+
+# Saved files get the usual permissions rather than mkstemp's private 0600
+_umask = os.umask(0)
+os.umask(_umask)
+FILE_MODE = 0o666 & ~_umask
+
+
+def collect_inputs(source):
+    # Image files in a directory, or matching a glob pattern, in sorted order
+    if os.path.isdir(source):
+        paths = [os.path.join(source, name) for name in os.listdir(source)]
+    else:
+        paths = glob.glob(source, recursive=True)
+    return sorted(p for p in paths if os.path.isfile(p) and p.lower().endswith(IMAGE_EXTENSIONS))
+
+
+def probe_size(path):
+    # Only reads the header
+    with Image.open(path) as im:
+        return im.size
+
+
+def choose_reduction(size, target):
+    # Largest supported factor that still leaves the long side at least `target` pixels
+    for factor in (8, 4, 2):
+        if max(size) / factor >= target:
+            return factor
+    return 1
+
+
+def read_image(path, reduce=1, memmap_path=None):
+    # Decodes straight into one BGR buffer. With `memmap_path`, images whose pixels are
+    # stored uncompressed are streamed band by band into an np.memmap at that path;
+    # compressed formats cannot be decoded partially and are read into memory.
+    if memmap_path is not None and reduce == 1:
+        img = read_raw_memmap(path, memmap_path)
+        if img is not None:
+            return img
+    img = cv2.imread(path, REDUCED_FLAGS[reduce])
+    if img is None:
+        img = read_with_pil(path, reduce)
+    return img
+
+
+def read_with_pil(path, reduce=1):
+    # Fallback for files OpenCV cannot decode
+    with Image.open(path) as im:
+        if reduce > 1:
+            target = (max(1, im.width // reduce), max(1, im.height // reduce))
+            im.draft("RGB", target)  # DCT scaling for JPEG, no-op for other formats
+            factor = im.width // target[0]
+            if factor > 1:
+                im = im.reduce(factor)
+        if im.mode in ("L", "I;16"):
+            return np.array(im)
+        rgb = np.array(im.convert("RGB"))
+    return cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR, dst=rgb)
+
+
+def read_raw_memmap(path, memmap_path):
+    # Uncompressed RGB/BGR pixel data (plain TIFF, BMP) is mapped from the file and
+    # copied into the BGR memmap one band at a time, so RAM use stays at one band.
+    with Image.open(path) as im:
+        if im.mode != "RGB" or len(im.tile) != 1:
+            return None
+        codec, _, offset, args = im.tile[0]
+        if codec != "raw" or not isinstance(args, tuple) or args[0] not in ("RGB", "BGR"):
+            return None
+        rawmode = args[0]
+        stride = (args[1] if len(args) > 1 else 0) or im.width * 3
+        orientation = args[2] if len(args) > 2 else 1
+        width, height = im.size
+
+    src = np.memmap(path, dtype=np.uint8, mode="r", offset=offset, shape=(height, stride))
+    dst = np.memmap(memmap_path, dtype=np.uint8, mode="w+", shape=(height, width, 3))
+    for y in range(0, height, MEMMAP_BAND_ROWS):
+        n = min(MEMMAP_BAND_ROWS, height - y)
+        if orientation < 0:
+            rows = src[height - y - n:height - y][::-1]
+        else:
+            rows = src[y:y + n]
+        rows = rows[:, :width * 3].reshape(n, width, 3)
+        dst[y:y + n] = rows[..., ::-1] if rawmode == "RGB" else rows
+    dst.flush()
+    return dst
+
+
+# Encoder settings per output format; the editor exposes these in its save options
+ENCODER_DEFAULTS = {
+    "png": {"compression": 3},                                       # 0 (fast) .. 9 (small)
+    "jpeg": {"quality": 95, "progressive": False, "optimize": False},
+    "webp": {"quality": 90},                                         # above 100 means lossless
+    "bmp": {},
+    "tiff": {},
+}
+FORMAT_EXTENSIONS = {
+    ".png": "png",
+    ".jpg": "jpeg",
+    ".jpeg": "jpeg",
+    ".webp": "webp",
+    ".bmp": "bmp",
+    ".tif": "tiff",
+    ".tiff": "tiff",
+}
+
+
+def format_for(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in FORMAT_EXTENSIONS:
+        raise ValueError(f"Unsupported output format: {ext or path}")
+    return FORMAT_EXTENSIONS[ext]
+
+
+def encode_params(fmt, options=None):
+    settings = dict(ENCODER_DEFAULTS[fmt], **(options or {}))
+    if fmt == "png":
+        return [cv2.IMWRITE_PNG_COMPRESSION, int(settings["compression"])]
+    if fmt == "jpeg":
+        return [cv2.IMWRITE_JPEG_QUALITY, int(settings["quality"]),
+                cv2.IMWRITE_JPEG_PROGRESSIVE, int(bool(settings["progressive"])),
+                cv2.IMWRITE_JPEG_OPTIMIZE, int(bool(settings["optimize"]))]
+    if fmt == "webp":
+        return [cv2.IMWRITE_WEBP_QUALITY, int(settings["quality"])]
+    return []
+
+
+def save_image(path, img, options=None):
+    # Encodes in memory and writes through a temp file in the same directory, which is
+    # then renamed over the target, so a failed or interrupted save never leaves a
+    # truncated file behind. Returns timings and the output size.
+    fmt = format_for(path)
+    if fmt not in ("png", "tiff"):
+        img = to_8bit(img)  # only PNG and TIFF store 16-bit samples
+    start = time.perf_counter()
+    ok, data = cv2.imencode(os.path.splitext(path)[1], img, encode_params(fmt, options))
+    if not ok:
+        raise IOError(f"Could not encode {path}")
+    encoded = time.perf_counter()
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data.tobytes())
+        os.chmod(tmp_path, FILE_MODE)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return {
+        "path": path,
+        "format": fmt,
+        "bytes": data.nbytes,
+        "encode_ms": 1000 * (encoded - start),
+        "write_ms": 1000 * (time.perf_counter() - encoded),
+    }
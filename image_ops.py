@@ -0,0 +1,58 @@
+import cv2
+import numpy as np
+
+
+# Edit operations are plain tuples so they can be stored in the history and replayed:
+#   ("crop", (x0, y0, x1, y1)), ("flip",), ("grayscale",), ("resize", (width, height)),
+#   ("adjust", (adjustment, ...)) with the tone adjustments described in filters.py
+#
+# Images keep their native layout: GRAY (2-D), BGR or BGRA, 8 or 16 bits per channel.
+# Grayscale results stay single-channel until they are exported.
+
+LAYOUTS = {1: "GRAY", 3: "BGR", 4: "BGRA"}
+GRAY_CODES = {"BGR": cv2.COLOR_BGR2GRAY, "BGRA": cv2.COLOR_BGRA2GRAY}
+
+
+def layout(img):
+    # (channel layout, bits per channel)
+    channels = 1 if img.ndim == 2 else img.shape[2]
+    return LAYOUTS[channels], img.dtype.itemsize * 8
+
+
+def root(img):
+    # The array that owns the memory behind `img` (itself unless it is a view)
+    while isinstance(img.base, np.ndarray):
+        img = img.base
+    return img
+
+
+def resident_bytes(arrays):
+    # RAM held by the arrays, counting each underlying buffer once; views share their
+    # parent's buffer and memory maps are backed by files rather than RAM
+    buffers = {}
+    for img in arrays:
+        if img is None:
+            continue
+        owner = root(img)
+        if not isinstance(owner, np.memmap):
+            buffers[id(owner)] = owner.nbytes
+    return sum(buffers.values())
+
+
+def frozen(img):
+    # Read-only alias of `img`. Source, result, keyframe and display buffers are shared
+    # (crops are views, flips are negative strides) rather than copied, so none of them
+    # may be modified in place: anything that needs to write takes its own .copy().
+    if not img.flags.writeable:
+        return img
+    view = img.view()
+    view.flags.writeable = False
+    return view
+
+
+def to_8bit(img):
+    if img.dtype == np.uint8:
+        return img
+    if img.dtype == np.uint16:
+        return (img >> 8).astype(np.uint8)
+    return np.clip(img * 255, 0, 255).astype(np.uint8)
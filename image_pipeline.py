@@ -0,0 +1,166 @@
+import filters
+import luma
+import resampling
+import tiling
+from image_ops import GRAY_CODES, frozen, layout, to_8bit
+from instrumentation import stage
+
+
+class Plan:
+    # A chain of crop/flip/grayscale/resize/adjust ops fused into a single crop
+    # rectangle on the source, an output size, two flags and one stack of tone
+    # adjustments. Adjustments act like an adjustment layer: they apply to the
+    # result wherever they appear in the chain, so they all compose into one LUT.
+    def __init__(self, width, height):
+        self.rect = (0, 0, width, height)
+        self.size = (width, height)
+        self.flipped = False
+        self.gray = False
+        self.adjustments = []
+
+    def add(self, op):
+        name = op[0]
+        if name == "adjust":
+            self.adjustments.extend(op[1])
+        elif name == "flip":
+            self.flipped = not self.flipped
+        elif name == "grayscale":
+            self.gray = True
+        elif name == "resize":
+            self.size = tuple(op[1])
+        elif name == "crop":
+            self._crop(*op[1])
+        else:
+            raise ValueError(f"Unknown operation: {name}")
+
+    def _crop(self, cx0, cy0, cx1, cy1):
+        # Map the crop from output coordinates back onto the source rectangle
+        width, height = self.size
+        x0, y0, x1, y1 = self.rect
+        if self.flipped:
+            cx0, cx1 = width - cx1, width - cx0
+        sx = (x1 - x0) / width
+        sy = (y1 - y0) / height
+        nx0, ny0 = x0 + round(cx0 * sx), y0 + round(cy0 * sy)
+        nx1 = max(nx0 + 1, x0 + round(cx1 * sx))
+        ny1 = max(ny0 + 1, y0 + round(cy1 * sy))
+        self.rect = (nx0, ny0, nx1, ny1)
+        self.size = (cx1 - cx0, cy1 - cy0)
+
+
+class Pipeline:
+    # Edits are recorded as nodes on top of a source image and only evaluated
+    # (in one fused pass) when the result is displayed or saved.
+    #
+    # `gray` is a view mode rather than an edit: the color source and ops stay as they
+    # are and the result is rendered from a cached luminance plane of the source.
+    # Results are cached per mode, so switching back and forth does no new work.
+    # `quality` is the resampling mode for resize ops (see resampling.py).
+    def __init__(self, source, ops=(), gray=False, quality=resampling.BALANCED):
+        self.gray = gray
+        self.quality = quality
+        self.reset(source, ops)
+
+    def reset(self, source, ops=()):
+        self.source = frozen(source)
+        self.ops = list(ops)
+        self._invalidate()
+
+    def push(self, op):
+        self.ops.append(op)
+        self._invalidate()
+
+    def set_gray(self, gray):
+        self.gray = gray
+
+    def snapshot(self):
+        # Independent copy that a worker thread can evaluate while edits continue
+        return Pipeline(self.source, self.ops, self.gray, self.quality)
+
+    def adopt(self, snapshot):
+        # Reuse what a snapshot already evaluated if it still describes this pipeline
+        if snapshot.source is self.source and snapshot.ops == self.ops:
+            self._plan = snapshot._plan or self._plan
+            self._imgs = {**snapshot._imgs, **self._imgs}
+
+    def buffers(self):
+        # Arrays held by the pipeline: the source and the cached results
+        return [self.source] + list(self._imgs.values())
+
+    def _invalidate(self):
+        self._plan = None
+        self._imgs = {}   # (gray view mode, resampling quality) -> result
+
+    def plan(self):
+        if self._plan is None:
+            plan = Plan(self.source.shape[1], self.source.shape[0])
+            for op in self.ops:
+                plan.add(op)
+            self._plan = plan
+        return self._plan
+
+    def size(self):
+        return self.plan().size
+
+    def resamples(self):
+        # Whether the result is resized from the source, i.e. depends on the quality mode
+        x0, y0, x1, y1 = self.plan().rect
+        return self.plan().size != (x1 - x0, y1 - y0)
+
+    def render(self, gray=None, quality=None):
+        # Current image in its native layout (GRAY stays single-channel), like cv_img.
+        # `gray` overrides the view mode, e.g. render(gray=False) for the color result,
+        # and `quality` the resampling mode, e.g. render(quality=resampling.BEST) to export.
+        plan = self.plan()
+        gray = self.gray if gray is None else gray
+        gray = gray and not plan.gray and layout(self.source)[0] != "GRAY"
+        quality = self.quality if quality is None else quality
+        if not self.resamples():
+            quality = None   # nothing is resampled, every mode gives the same result
+        key = (gray, quality)
+        img = self._imgs.get(key)
+        if img is None:
+            img = self._imgs[key] = frozen(self._evaluate(gray, quality))
+        return img
+
+    def render_display(self):
+        # 8-bit version for the screen; the same buffer when the image is already 8-bit.
+        # Conversion to RGB happens per tile, never on the whole frame.
+        return to_8bit(self.render())
+
+    def _evaluate(self, gray=False, quality=None):
+        plan = self.plan()
+        x0, y0, x1, y1 = plan.rect
+        if gray:
+            with stage("render.luma"):
+                img = luma.luminance(self.source, plan.rect)
+        else:
+            img = self.source[y0:y1, x0:x1]
+
+        # Colour conversion, the flip and the LUT treat pixels independently and commute
+        # with the resize, so they run over strips on whichever side of it is smaller
+        shrink = plan.size[0] * plan.size[1] < (x1 - x0) * (y1 - y0)
+        if shrink:
+            with stage("render.resize", size=plan.size, quality=quality):
+                img = resampling.resize(img, plan.size, quality)
+
+        name, _ = layout(img)
+        flip = plan.flipped
+        if plan.gray and name != "GRAY":
+            with stage("render.cvtColor"):
+                img = tiling.to_gray(img, GRAY_CODES[name], flip=flip)
+            flip = False
+        # The merged LUT always runs last, after any grayscale conversion and resize in the
+        # chain, wherever the adjust ops were. That equals applying each op in order only
+        # because every adjustment maps all channels through the same curve.
+        if not filters.is_identity(plan.adjustments):
+            with stage("render.lut"):
+                img = filters.apply_lut(img, filters.build_lut(plan.adjustments, img.dtype))
+        if flip:
+            # Mirrored by striding backwards; whatever reads it copies only what it needs
+            img = img[:, ::-1]
+
+        if plan.size != (img.shape[1], img.shape[0]):
+            with stage("render.resize", size=plan.size, quality=quality):
+                img = resampling.resize(img, plan.size, quality)
+        return img
@@ -0,0 +1,120 @@
+import atexit
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# EDITOR_TRACE=path.json writes every timed stage to a Chrome trace-event file on exit
+# (open it in chrome://tracing or ui.perfetto.dev) and prints a per-stage summary;
+# EDITOR_TRACE=1 uses the default name.
+TRACE_ENV = "EDITOR_TRACE"
+DEFAULT_TRACE_PATH = "editor_trace.json"
+# EDITOR_HUD=1 shows the timing overlay from the start (toggle it with "h")
+HUD_ENV = "EDITOR_HUD"
+
+
+class Instruments:
+    # Wall-clock timers around the editor's hot paths. Stages can be timed from any
+    # thread; they are cheap enough to stay on, and only kept as trace events when
+    # a trace file was requested.
+    def __init__(self, trace_path=None):
+        self.lock = threading.Lock()
+        self.start = time.perf_counter()
+        self.recent = {}    # stage -> [total ms, calls] since the last take_recent()
+        self.totals = {}    # stage -> [total ms, calls, max ms]
+        self.trace_path = trace_path
+        self.events = [] if trace_path else None
+        self.threads = {}   # thread id -> name, for the trace viewer
+
+    @contextmanager
+    def stage(self, name, **args):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start, time.perf_counter(), args)
+
+    def timed(self, name):
+        # Decorator form of stage()
+        def decorate(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.stage(name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def record(self, name, start, end, args=None):
+        ms = 1000 * (end - start)
+        with self.lock:
+            recent = self.recent.setdefault(name, [0.0, 0])
+            recent[0] += ms
+            recent[1] += 1
+            total = self.totals.setdefault(name, [0.0, 0, 0.0])
+            total[0] += ms
+            total[1] += 1
+            total[2] = max(total[2], ms)
+            if self.events is not None:
+                tid = threading.get_ident()
+                self.threads.setdefault(tid, threading.current_thread().name)
+                self.events.append({
+                    "name": name, "cat": name.split(".")[0], "ph": "X", "pid": os.getpid(), "tid": tid,
+                    "ts": 1e6 * (start - self.start), "dur": 1e6 * (end - start), "args": args or {},
+                })
+
+    def take_recent(self):
+        # {stage: (total ms, calls)} since the previous call
+        with self.lock:
+            recent, self.recent = self.recent, {}
+        return {name: tuple(value) for name, value in recent.items()}
+
+    def summary(self):
+        # [(stage, calls, mean ms, max ms)], slowest total first
+        with self.lock:
+            totals = sorted(self.totals.items(), key=lambda item: -item[1][0])
+        return [(name, calls, total / calls, peak) for name, (total, calls, peak) in totals]
+
+    def dump(self, path=None):
+        path = path or self.trace_path
+        if not path or self.events is None:
+            return
+        with self.lock:
+            events = list(self.events)
+            threads = dict(self.threads)
+        events += [{"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": name}}
+                   for tid, name in threads.items()]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        # The per-stage totals go to stderr alongside, for a look without the viewer
+        print(f"Trace written to {path}", file=sys.stderr)
+        for name, calls, mean, peak in self.summary():
+            print(f"  {name:<24}{calls:7d} calls  {mean:9.2f} ms mean  {peak:9.2f} ms max", file=sys.stderr)
+
+
+def memory_mb():
+    # Resident set size of the process; peak RSS where /proc is not available
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 2 ** 20 if os.uname().sysname == "Darwin" else rss / 1024
+
+
+_trace_path = os.environ.get(TRACE_ENV)
+if _trace_path == "1":
+    _trace_path = DEFAULT_TRACE_PATH
+instruments = Instruments(_trace_path or None)
+if instruments.trace_path:
+    atexit.register(instruments.dump)
+
+stage = instruments.stage
+timed = instruments.timed
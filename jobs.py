@@ -0,0 +1,93 @@
+import os
+import queue
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+POLL_MS = 15
+
+
+class JobRunner:
+    # Runs image work on a thread pool (OpenCV releases the GIL while it works) and
+    # delivers results on the Tk thread by polling a queue through root.after.
+    # Jobs are submitted under a key; a newer job with the same key supersedes the
+    # older one, which is cancelled if it has not started and ignored if it has.
+    def __init__(self, root, max_workers=None, on_progress=None):
+        self.root = root
+        self.executor = ThreadPoolExecutor(max_workers=max_workers or os.cpu_count() or 2)
+        self.results = queue.Queue()
+        self.generations = {}   # key -> generation of the latest submitted job
+        self.active = {}        # key -> (future, label, start time)
+        self.on_progress = on_progress
+        self.polling = False
+
+    def submit(self, key, fn, *args, on_done=None, on_error=None, label=None):
+        generation = self.generations.get(key, 0) + 1
+        self.generations[key] = generation
+        self.cancel_running(key)
+
+        future = self.executor.submit(fn, *args)
+        self.active[key] = (future, label or key, time.perf_counter())
+        callbacks = (on_done, on_error)
+        future.add_done_callback(lambda f: self.results.put((key, generation, f, callbacks)))
+        if not self.polling:
+            self.polling = True
+            self.root.after(POLL_MS, self._poll)
+        self._report()
+        return future
+
+    def cancel(self, key):
+        # Forget the job; its result is dropped if it still completes
+        self.generations[key] = self.generations.get(key, 0) + 1
+        self.cancel_running(key)
+        self._report()
+
+    def cancel_running(self, key):
+        job = self.active.pop(key, None)
+        if job is not None:
+            job[0].cancel()
+
+    def busy(self, key=None):
+        if key is None:
+            return bool(self.active)
+        return key in self.active
+
+    def _poll(self):
+        while True:
+            try:
+                key, generation, future, (on_done, on_error) = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if generation != self.generations.get(key) or future.cancelled():
+                continue  # superseded
+            self.active.pop(key, None)
+            try:
+                self._deliver(future, on_done, on_error)
+            except Exception as error:
+                # A failing callback must not stop the delivery of later results
+                traceback.print_exception(error)
+
+        self._report()
+        if self.active or not self.results.empty():
+            self.root.after(POLL_MS, self._poll)
+        else:
+            self.polling = False
+
+    def _deliver(self, future, on_done, on_error):
+        error = future.exception()
+        if error is not None:
+            if on_error is not None:
+                on_error(error)
+            else:
+                traceback.print_exception(error)
+        elif on_done is not None:
+            on_done(future.result())
+
+    def _report(self):
+        if self.on_progress is None:
+            return
+        now = time.perf_counter()
+        self.on_progress([(label, now - start) for _, label, start in self.active.values()])
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,97 @@
+import threading
+import weakref
+
+import cv2
+import numpy as np
+
+import tiling
+from image_ops import GRAY_CODES, layout, root
+
+BLOCK_SIZE = 512
+
+_planes = {}   # id(colour buffer) -> LumaPlane
+_planes_lock = threading.Lock()
+
+
+class LumaPlane:
+    # 1-channel luminance of a colour buffer, converted block by block on first use,
+    # so only the regions that are actually shown (e.g. what is left after a crop)
+    # are ever converted, and each of them only once.
+    def __init__(self, img):
+        self.ref = weakref.ref(img)
+        self.code = GRAY_CODES[layout(img)[0]]
+        self.plane = tiling.allocate(img.shape[:2], img.dtype, img)
+        self.valid = np.zeros((-(-img.shape[0] // BLOCK_SIZE), -(-img.shape[1] // BLOCK_SIZE)), bool)
+        self.lock = threading.Lock()
+
+    def region(self, x0, y0, x1, y1):
+        img = self.ref()
+        b = BLOCK_SIZE
+        with self.lock:
+            rows = slice(y0 // b, -(-y1 // b))
+            cols = slice(x0 // b, -(-x1 // b))
+            missing = np.argwhere(~self.valid[rows, cols]) + (rows.start, cols.start)
+
+            def convert(by, bx):
+                ys, xs = slice(by * b, (by + 1) * b), slice(bx * b, (bx + 1) * b)
+                self.plane[ys, xs] = cv2.cvtColor(img[ys, xs], self.code)
+
+            tiling.run([lambda by=by, bx=bx: convert(by, bx) for by, bx in missing])
+            self.valid[rows, cols] = True
+        return self.plane[y0:y1, x0:x1]
+
+
+def _offset(img, owner):
+    # (row, column) of img[0, 0] inside `owner` if img is a plain window into it
+    if img.strides != owner.strides or img.shape[2:] != owner.shape[2:]:
+        return None
+    delta = img.__array_interface__["data"][0] - owner.__array_interface__["data"][0]
+    y, rest = divmod(delta, owner.strides[0])
+    return y, rest // owner.strides[1]
+
+
+def _cached(arrays):
+    # id -> plane for the buffers behind `arrays` that have one
+    found = {}
+    with _planes_lock:
+        for img in arrays:
+            if img is None:
+                continue
+            owner = root(img)
+            plane = _planes.get(id(owner))
+            if plane is not None and plane.ref() is owner:
+                found[id(owner)] = plane
+    return found
+
+
+def planes(arrays):
+    # The cached planes of the buffers behind `arrays`, so they count toward their memory
+    return [plane.plane for plane in _cached(arrays).values()]
+
+
+def drop(arrays):
+    # Forget the planes of the buffers behind `arrays`; they are rebuilt on next use
+    found = _cached(arrays)
+    with _planes_lock:
+        for key, plane in found.items():
+            if _planes.get(key) is plane:
+                del _planes[key]
+
+
+def luminance(img, rect):
+    # Luminance of the colour image `img` inside rect (x0, y0, x1, y1). Windows into a
+    # buffer share that buffer's cached plane; anything else is converted directly.
+    x0, y0, x1, y1 = rect
+    owner = root(img)
+    offset = _offset(img, owner)
+    if offset is None:
+        return tiling.to_gray(img[y0:y1, x0:x1], GRAY_CODES[layout(img)[0]])
+
+    with _planes_lock:
+        plane = _planes.get(id(owner))
+        if plane is None or plane.ref() is not owner:
+            plane = _planes[id(owner)] = LumaPlane(owner)
+            # The plane goes away with the buffer it was made from
+            weakref.finalize(owner, _planes.pop, id(owner), None)
+    oy, ox = offset
+    return plane.region(x0 + ox, y0 + oy, x1 + ox, y1 + oy)
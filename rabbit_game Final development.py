@@ -2,6 +2,10 @@ import pygame
 import random
 import math
 
+import replay
+from hud_text import TextCache, debug_enabled
+from spatial_hash import SpatialGroup
+
 # Initialize
 pygame.init()
 pygame.mixer.init()
@@ -25,18 +29,32 @@ GREEN = (0, 255, 0)
 BLACK = (0, 0, 0)
 FPS = 60
 GRAVITY = 1
+GAME = "final"   # names this game in input recordings (replay.py)
 
 clock = pygame.time.Clock()
 
-# Groups
+# HUD text is rendered once per distinct value
+text_cache = TextCache()
+debug = debug_enabled()
+
+# Groups; enemies and fireballs are also filed in a grid for collision checks
 all_sprites = pygame.sprite.Group()
 projectiles = pygame.sprite.Group()
-enemies = pygame.sprite.Group()
-fireballs = pygame.sprite.Group()
+enemies = SpatialGroup()
+fireballs = SpatialGroup()
 
-# Game state
+# Game state; timers count frames so a recorded run replays the same at any speed
 level = 1
+frame = 0
 level_timer = 0
+wave_frame = None
+# All randomness comes from here; main seeds it so runs can be reproduced
+rng = random.Random()
+
+# Input recording and replay (RABBIT_RECORD / RABBIT_REPLAY, see replay.py)
+recorder = None
+playback = None
+fast_forward = False   # replaying uncapped: no frame cap and no message waits
 
 class Player(pygame.sprite.Sprite):
     def __init__(self):
@@ -126,12 +144,12 @@ class FlyingEnemy(pygame.sprite.Sprite):
         self.rect.x = x
         self.base_y = SCREEN_HEIGHT - 80
         self.rect.y = self.base_y
-        self.speed_x = random.randint(2, 4)
+        self.speed_x = rng.randint(2, 4)
         self.amplitude = 10
         self.frequency = 0.12
         self.tick = 0
         self.health = 30
-        self.fireball_timer = random.randint(60, 120)
+        self.fireball_timer = rng.randint(60, 120)
 
     def update(self):
         self.rect.x -= self.speed_x
@@ -142,7 +160,7 @@ class FlyingEnemy(pygame.sprite.Sprite):
             fireball = Fireball(self.rect.centerx, self.rect.centery)
             fireballs.add(fireball)
             all_sprites.add(fireball)
-            self.fireball_timer = random.randint(90, 150)
+            self.fireball_timer = rng.randint(90, 150)
         if self.health <= 0 or self.rect.right < 0:
             self.kill()
 
@@ -154,7 +172,7 @@ class BossEnemy(pygame.sprite.Sprite):
         self.rect.x = SCREEN_WIDTH
         self.rect.y = SCREEN_HEIGHT - 150
         self.health = health
-        self.speed_x = random.randint(1, 3)
+        self.speed_x = rng.randint(1, 3)
 
     def update(self):
         self.rect.x -= self.speed_x
@@ -166,19 +184,36 @@ def draw_health_bar():
     pygame.draw.rect(screen, GREEN, (10, 10, 200 * (player.health / 100), 20))
 
 def draw_score():
-    screen.blit(pygame.font.Font(None, 36).render(f"Score: {player.score}", True, WHITE), (SCREEN_WIDTH - 150, 10))
+    screen.blit(text_cache.render(f"Score: {player.score}", 36, WHITE), (SCREEN_WIDTH - 150, 10))
 
 def draw_lives():
-    screen.blit(pygame.font.Font(None, 36).render(f"Lives: {player.lives}", True, WHITE), (SCREEN_WIDTH - 150, 50))
+    screen.blit(text_cache.render(f"Lives: {player.lives}", 36, WHITE), (SCREEN_WIDTH - 150, 50))
 
 def draw_level():
-    screen.blit(pygame.font.Font(None, 36).render(f"Level: {level}", True, WHITE), (10, 40))
+    screen.blit(text_cache.render(f"Level: {level}", 36, WHITE), (10, 40))
+
+def draw_debug():
+    if debug:
+        text_cache.draw_stats(screen, (10, SCREEN_HEIGHT - 24))
+
+def hold(ms):
+    if not fast_forward:
+        pygame.time.wait(ms)
+
+def end_run(frames):
+    # The run is over after `frames` frames: finish its recording, and stop here when
+    # it was a replay
+    if recorder:
+        recorder.close(frames)
+    if playback:
+        print(f"Replayed {frames} frames: level {level}, score {player.score}, lives {player.lives}")
+        pygame.quit(); exit()
 
 def show_restart_menu():
-    font = pygame.font.Font(None, 48)
+    end_run(frame + 1)   # called from within the last frame
     while True:
         screen.fill(BLACK)
-        text = font.render("Press R to Restart or Q to Quit", True, WHITE)
+        text = text_cache.render("Press R to Restart or Q to Quit", 48, WHITE)
         screen.blit(text, (SCREEN_WIDTH // 2 - 250, SCREEN_HEIGHT // 2 - 30))
         pygame.display.flip()
         for event in pygame.event.get():
@@ -193,35 +228,33 @@ def show_restart_menu():
 
 def show_fail_screen():
     screen.fill(BLACK)
-    text = pygame.font.Font(None, 64).render("You Failed! Time's up!", True, RED)
+    text = text_cache.render("You Failed! Time's up!", 64, RED)
     screen.blit(text, (SCREEN_WIDTH // 2 - 220, SCREEN_HEIGHT // 2 - 50))
     pygame.display.flip()
-    pygame.time.wait(3000)
+    hold(3000)
     show_restart_menu()
 
 def game_over():
     screen.fill(BLACK)
-    text = pygame.font.Font(None, 64).render("GAME OVER", True, RED)
+    text = text_cache.render("GAME OVER", 64, RED)
     screen.blit(text, (SCREEN_WIDTH // 2 - 160, SCREEN_HEIGHT // 2 - 50))
     pygame.display.flip()
-    pygame.time.wait(3000)
+    hold(3000)
     show_restart_menu()
 
 def show_main_menu():
-    font_title = pygame.font.Font(None, 72)
-    font_option = pygame.font.Font(None, 48)
     selected = 0
     options = ["Start Game", "Quit"]
     menu_running = True
 
     while menu_running:
         screen.fill(BLACK)
-        title = font_title.render("Animal Hero: Rabbit vs Dragon", True, GREEN)
+        title = text_cache.render("Animal Hero: Rabbit vs Dragon", 72, GREEN)
         screen.blit(title, (SCREEN_WIDTH // 2 - title.get_width() // 2, 150))
 
         for i, option in enumerate(options):
             color = GREEN if i == selected else WHITE
-            text = font_option.render(option, True, color)
+            text = text_cache.render(option, 48, color)
             screen.blit(text, (SCREEN_WIDTH // 2 - text.get_width() // 2, 280 + i * 60))
 
         pygame.display.flip()
@@ -238,7 +271,7 @@ def show_main_menu():
                         pygame.quit(); exit()
 
 def start_level(lvl):
-    global level_timer
+    global level_timer, wave_frame
     enemies.empty()
     fireballs.empty()
     projectiles.empty()
@@ -258,88 +291,101 @@ def start_level(lvl):
             enemies.add(e)
             all_sprites.add(e)
     elif lvl == 3:
-        level_timer = pygame.time.get_ticks() + 60000
+        level_timer = frame + 60 * FPS
         for i in range(10):
             e = Enemy(SCREEN_WIDTH + i * 80, SCREEN_HEIGHT - 70)
             enemies.add(e)
             all_sprites.add(e)
-        pygame.time.set_timer(pygame.USEREVENT + 1, 5000)
+        wave_frame = frame + 5 * FPS
 
 player = Player()
 all_sprites.add(player)
 
 def main():
-    global level
-    show_main_menu()
+    global level, debug, frame, wave_frame
+    if playback is None:
+        show_main_menu()
     start_level(level)
     running = True
     while running:
-        clock.tick(FPS)
-        for event in pygame.event.get():
+        if fast_forward:
+            clock.tick()
+        else:
+            clock.tick(FPS)
+        events = pygame.event.get()
+        if playback:
+            # Keys come from the recording; the window can still be closed
+            events = [event for event in events if event.type == pygame.QUIT] + playback.events(frame)
+        for event in events:
+            if recorder:
+                recorder.record(frame, event)
             if event.type == pygame.QUIT: running = False
             elif event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_LEFT: player.move_left()
                 elif event.key == pygame.K_RIGHT: player.move_right()
                 elif event.key == pygame.K_UP: player.jump()
                 elif event.key == pygame.K_SPACE: player.shoot()
+                elif event.key == pygame.K_F3: debug = not debug
             elif event.type == pygame.KEYUP:
                 if event.key in [pygame.K_LEFT, pygame.K_RIGHT]: player.stop()
-            elif event.type == pygame.USEREVENT + 1 and level == 3:
-                for i in range(7):
-                    f = FlyingEnemy(SCREEN_WIDTH + i * 90)
-                    enemies.add(f)
-                    all_sprites.add(f)
-                for i in range(7):
-                    b = BossEnemy(health=30)
-                    b.rect.x = SCREEN_WIDTH + i * 120
-                    enemies.add(b)
-                    all_sprites.add(b)
-                pygame.time.set_timer(pygame.USEREVENT + 1, 0)
+
+        if level == 3 and frame == wave_frame:
+            for i in range(7):
+                f = FlyingEnemy(SCREEN_WIDTH + i * 90)
+                enemies.add(f)
+                all_sprites.add(f)
+            for i in range(7):
+                b = BossEnemy(health=30)
+                b.rect.x = SCREEN_WIDTH + i * 120
+                enemies.add(b)
+                all_sprites.add(b)
+            wave_frame = None
 
         screen.blit(background_image, (0, 0))
         all_sprites.update()
+        enemies.rehash()
+        fireballs.rehash()
 
-        if level == 3 and pygame.time.get_ticks() > level_timer and len(enemies) > 0:
+        if level == 3 and frame > level_timer and len(enemies) > 0:
             show_fail_screen()
 
-        for bullet in projectiles:
-            for enemy in pygame.sprite.spritecollide(bullet, enemies, False):
+        for bullet, enemies_hit in enemies.groupcollide(projectiles).items():
+            for enemy in enemies_hit:
                 enemy.health -= 10
                 bullet.kill()
                 player.score += 10
 
-        for fb in fireballs:
-            if player.rect.colliderect(fb.rect):
-                fb.kill()
-                player.health -= 10
-                if player.health <= 0:
-                    player.lives -= 1
-                    player.health = 100
-                    if player.lives <= 0:
-                        game_over()
-
-        for enemy in enemies:
-            if player.rect.colliderect(enemy.rect):
-                player.health -= 20
-                enemy.kill()
-                if player.health <= 0:
-                    player.lives -= 1
-                    player.health = 100
-                    if player.lives <= 0:
-                        game_over()
+        for fb in fireballs.collide(player):
+            fb.kill()
+            player.health -= 10
+            if player.health <= 0:
+                player.lives -= 1
+                player.health = 100
+                if player.lives <= 0:
+                    game_over()
+
+        for enemy in enemies.collide(player):
+            player.health -= 20
+            enemy.kill()
+            if player.health <= 0:
+                player.lives -= 1
+                player.health = 100
+                if player.lives <= 0:
+                    game_over()
 
         if len(enemies) == 0:
-            if level != 3 or pygame.time.get_ticks() <= level_timer:
+            if level != 3 or frame <= level_timer:
                 screen.fill(BLACK)
-                screen.blit(pygame.font.Font(None, 64).render("Level Complete!", True, GREEN), (SCREEN_WIDTH//2 - 180, SCREEN_HEIGHT//2 - 50))
+                screen.blit(text_cache.render("Level Complete!", 64, GREEN), (SCREEN_WIDTH//2 - 180, SCREEN_HEIGHT//2 - 50))
                 pygame.display.flip()
-                pygame.time.wait(2000)
+                hold(2000)
                 level += 1
                 if level > 3:
                     screen.fill(BLACK)
-                    screen.blit(pygame.font.Font(None, 64).render("You Win! Congratulations!", True, GREEN), (SCREEN_WIDTH // 2 - 300, SCREEN_HEIGHT // 2 - 50))
+                    screen.blit(text_cache.render("You Win! Congratulations!", 64, GREEN), (SCREEN_WIDTH // 2 - 300, SCREEN_HEIGHT // 2 - 50))
                     pygame.display.flip()
-                    pygame.time.wait(3000)
+                    hold(3000)
+                    end_run(frame + 1)
                     break
                 else:
                     player.health = 100
@@ -349,10 +395,21 @@ def main():
         draw_score()
         draw_lives()
         draw_level()
+        draw_debug()
         all_sprites.draw(screen)
         pygame.display.flip()
 
+        frame += 1
+        if playback and frame >= playback.length:
+            break
+
+    end_run(frame)
+    if debug:
+        print(text_cache.stats())
     pygame.quit()
 
 if __name__ == "__main__":
+    seed, recorder, playback = replay.open_from_env(GAME)
+    rng.seed(seed)
+    fast_forward = playback is not None and replay.uncapped()
     main()
\ No newline at end of file
@@ -1,13 +1,16 @@
 import pygame
-import random
+
+import game_sim
+import replay
+from dirty_render import FrameRenderer, dirty_enabled
+from game_sim import SCREEN_WIDTH, SCREEN_HEIGHT, STEP_MS
+from hud_text import TextCache, debug_enabled
 
 # Initialize Pygame
 pygame.init()
 pygame.mixer.init()
 
 # Game Settings
-SCREEN_WIDTH = 800
-SCREEN_HEIGHT = 600
 screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
 pygame.display.set_caption('Animal Hero: Rabbit vs Dragon')
 
@@ -19,6 +22,10 @@ background_image = pygame.transform.scale(background_image, (SCREEN_WIDTH, SCREE
 dragon_image = pygame.image.load("dragon.png").convert_alpha()
 dragon_image = pygame.transform.scale(dragon_image, (50, 50))
 
+player_image = pygame.image.load("human_with_gun.png").convert_alpha()
+player_image = pygame.transform.scale(player_image, (50, 50))
+images = {"player": player_image, "dragon": dragon_image}
+
 # Load sound
 shoot_sound = pygame.mixer.Sound('shoot.wav')
 shoot_sound.set_volume(0.5)
@@ -30,172 +37,86 @@ RED = (255, 0, 0)
 GREEN = (0, 255, 0)
 FPS = 60
 clock = pygame.time.Clock()
-GRAVITY = 1
+# The world steps at a fixed rate; a slow frame runs several steps to catch up, up to
+# this many, beyond which the game slows down instead
+MAX_STEPS_PER_FRAME = 5
+
+# HUD text is rendered once per distinct value
+text_cache = TextCache()
+debug = debug_enabled()
+
+# Set while replaying a recording uncapped; skips the frame cap and message waits
+fast_forward = False
 
 # Pause menu state
 paused = False
 pause_options = ["Resume", "Quit"]
 pause_selected = 0
 
-class Player(pygame.sprite.Sprite):
-    def __init__(self):
-        super().__init__()
-        self.image = pygame.image.load("human_with_gun.png").convert_alpha()
-        self.image = pygame.transform.scale(self.image, (50, 50))
-        self.rect = self.image.get_rect()
-        self.rect.x = 100
-        self.rect.y = SCREEN_HEIGHT - 70
-        self.speed_x = 0
-        self.speed_y = 0
-        self.is_jumping = False
-        self.health = 100
-        self.lives = 3
-        self.score = 0
-
-    def update(self):
-        self.rect.x += self.speed_x
-        self.speed_y += GRAVITY
-        self.rect.y += self.speed_y
-
-        if self.rect.y > SCREEN_HEIGHT - 70:
-            self.rect.y = SCREEN_HEIGHT - 70
-            self.is_jumping = False
-            self.speed_y = 0
-
-        if self.rect.x < 0:
-            self.rect.x = 0
-        elif self.rect.x > SCREEN_WIDTH - self.rect.width:
-            self.rect.x = SCREEN_WIDTH - self.rect.width
-
-    def jump(self):
-        if not self.is_jumping:
-            self.speed_y = -15
-            self.is_jumping = True
-
-    def move_left(self):
-        self.speed_x = -5
-
-    def move_right(self):
-        self.speed_x = 5
-
-    def stop(self):
-        self.speed_x = 0
-
-    def shoot(self):
-        bullet = Projectile(self.rect.centerx, self.rect.centery)
-        all_sprites.add(bullet)
-        projectiles.add(bullet)
-        shoot_sound.play()
-
-class Projectile(pygame.sprite.Sprite):
-    def __init__(self, x, y):
-        super().__init__()
-        self.image = pygame.Surface((10, 5))
-        self.image.fill(RED)
-        self.rect = self.image.get_rect()
-        self.rect.center = (x, y)
-        self.speed_x = 10
-
-    def update(self):
-        self.rect.x += self.speed_x
-        if self.rect.x > SCREEN_WIDTH:
-            self.kill()
-
-class Enemy(pygame.sprite.Sprite):
-    def __init__(self, x, y, flying=False):
-        super().__init__()
-        self.image = dragon_image
-        self.rect = self.image.get_rect()
-        self.rect.x = x
-        self.flying = flying
-        self.base_y = y
-        self.rect.y = y
-        self.health = 30
-        self.speed_x = 2
-        self.jump_direction = 1
-        self.jump_range = 40
-        self.jump_counter = 0
-
-    def update(self):
-        self.rect.x -= self.speed_x
-        if self.flying:
-            self.jump_counter += self.jump_direction
-            self.rect.y = self.base_y + int(self.jump_range * pygame.math.sin(self.jump_counter * 0.1))
-            if abs(self.jump_counter) > 60:
-                self.jump_direction *= -1
-        if self.health <= 0:
-            self.kill()
-        if self.rect.right < 0:
-            self.kill()
-
-class BossEnemy(pygame.sprite.Sprite):
-    def __init__(self, health=150):
-        super().__init__()
-        self.image = pygame.transform.scale(dragon_image, (120, 120))
-        self.rect = self.image.get_rect()
-        self.rect.x = SCREEN_WIDTH
-        self.rect.y = SCREEN_HEIGHT - 150
-        self.health = health
-
-    def update(self):
-        self.rect.x -= random.randint(1, 3)
-        if self.health <= 0:
-            self.kill()
-        if self.rect.right < 0:
-            self.kill()
-
-def draw_health_bar():
+# HUD drawing functions return the area they drew, for dirty-rectangle updates
+def draw_health_bar(world):
     health_bar_width = 200
-    health_percentage = player.health / 100
-    pygame.draw.rect(screen, RED, (10, 10, health_bar_width, 20))
+    health_percentage = world.player.health / 100
+    area = pygame.draw.rect(screen, RED, (10, 10, health_bar_width, 20))
     pygame.draw.rect(screen, GREEN, (10, 10, health_bar_width * health_percentage, 20))
+    return area
 
-def draw_score():
-    font = pygame.font.Font(None, 36)
-    text = font.render(f"Score: {player.score}", True, WHITE)
-    screen.blit(text, (SCREEN_WIDTH - 150, 10))
+def draw_score(world):
+    text = text_cache.render(f"Score: {world.player.score}", 36, WHITE)
+    return screen.blit(text, (SCREEN_WIDTH - 150, 10))
 
-def draw_lives():
-    font = pygame.font.Font(None, 36)
-    text = font.render(f"Lives: {player.lives}", True, WHITE)
-    screen.blit(text, (SCREEN_WIDTH - 150, 50))
+def draw_lives(world):
+    text = text_cache.render(f"Lives: {world.player.lives}", 36, WHITE)
+    return screen.blit(text, (SCREEN_WIDTH - 150, 50))
 
-def draw_level():
-    font = pygame.font.Font(None, 36)
-    text = font.render(f"Level: {level}", True, WHITE)
-    screen.blit(text, (10, 40))
+def draw_level(world):
+    text = text_cache.render(f"Level: {world.level}", 36, WHITE)
+    return screen.blit(text, (10, 40))
 
-def draw_level_timer(level_duration):
-    time_elapsed = pygame.time.get_ticks() - level_start_time
-    time_left = max(0, (level_duration - time_elapsed) // 1000)
-    font = pygame.font.Font(None, 36)
-    text = font.render(f"Time Left: {time_left}s", True, WHITE)
-    screen.blit(text, (10, 70))
+def draw_level_timer(world):
+    text = text_cache.render(f"Time Left: {world.time_left()}s", 36, WHITE)
+    return screen.blit(text, (10, 70))
+
+def draw_debug():
+    if debug:
+        return text_cache.draw_stats(screen, (10, SCREEN_HEIGHT - 24))
+
+def draw_hud(renderer, world):
+    renderer.overlay(draw_health_bar(world))
+    renderer.overlay(draw_score(world))
+    renderer.overlay(draw_lives(world))
+    renderer.overlay(draw_level(world))
+    renderer.overlay(draw_level_timer(world))
+    renderer.overlay(draw_debug())
 
 def draw_pause_menu():
     screen.fill(BLACK)
-    font = pygame.font.Font(None, 64)
-    title = font.render("Game Paused", True, WHITE)
+    title = text_cache.render("Game Paused", 64, WHITE)
     screen.blit(title, (SCREEN_WIDTH // 2 - 150, 150))
-    option_font = pygame.font.Font(None, 48)
     for i, option in enumerate(pause_options):
         color = GREEN if i == pause_selected else WHITE
-        text = option_font.render(option, True, color)
+        text = text_cache.render(option, 48, color)
         screen.blit(text, (SCREEN_WIDTH // 2 - 100, 250 + i * 60))
     pygame.display.flip()
 
+def hold(ms):
+    if not fast_forward:
+        pygame.time.wait(ms)
+
+def draw_message(text, color, x):
+    screen.fill(BLACK)
+    text = text_cache.render(text, 64, color)
+    screen.blit(text, (x, SCREEN_HEIGHT // 2 - 50))
+    pygame.display.flip()
+
 def game_over():
-    font = pygame.font.Font(None, 64)
-    text = font.render("GAME OVER", True, RED)
+    text = text_cache.render("GAME OVER", 64, RED)
     screen.blit(text, (SCREEN_WIDTH // 2 - 160, SCREEN_HEIGHT // 2 - 50))
     pygame.display.flip()
-    pygame.time.wait(3000)
-    pygame.quit()
-    exit()
+    hold(3000)
 
 def show_instructions():
     screen.fill(BLACK)
-    font = pygame.font.Font(None, 48)
     instructions = [
         "Welcome to Animal Hero: Rabbit vs Dragon!",
         "Arrow keys to move, UP to jump, SPACE to shoot.",
@@ -204,7 +125,7 @@ def show_instructions():
         "Press any key to start..."
     ]
     for i, line in enumerate(instructions):
-        text = font.render(line, True, WHITE)
+        text = text_cache.render(line, 48, WHITE)
         screen.blit(text, (50, 100 + i * 50))
     pygame.display.flip()
     wait_for_keypress()
@@ -220,35 +141,31 @@ def wait_for_keypress():
                 waiting = False
 
 def main():
-    global player, all_sprites, projectiles, enemies, level, level_in_progress, level_complete_timer, current_wave, waves, level_start_time
-    player = Player()
-    all_sprites = pygame.sprite.Group()
-    projectiles = pygame.sprite.Group()
-    enemies = pygame.sprite.Group()
-    all_sprites.add(player)
-
-    level = 1
-    level_in_progress = True
-    level_complete_timer = 0
-    current_wave = 0
-    waves = []
-    LEVEL_DURATION = 60000
-    level_start_time = pygame.time.get_ticks()
-
-    show_instructions()
-    start_level(level)
-
+    global paused, pause_selected, debug, fast_forward
+    # RABBIT_RECORD / RABBIT_REPLAY record this run's keys or play a recorded run back
+    seed, recorder, playback = replay.open_from_env(game_sim.GAME)
+    fast_forward = playback is not None and replay.uncapped()
+    world = game_sim.World(images=images, seed=seed)
+    controls = game_sim.Controls()
+    renderer = FrameRenderer(screen, background_image, dirty=dirty_enabled())
+    if playback is None:
+        show_instructions()
+
+    clock.tick()
+    replay_start = pygame.time.get_ticks()
+    lag = 0
     running = True
     while running:
-        clock.tick(FPS)
+        lag += clock.tick() if fast_forward else clock.tick(FPS)
 
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 running = False
             elif event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_p:
-                    global paused
                     paused = not paused
+                elif event.key == pygame.K_F3:
+                    debug = not debug
                 elif paused:
                     if event.key == pygame.K_UP:
                         pause_selected = (pause_selected - 1) % len(pause_options)
@@ -258,127 +175,70 @@ def main():
                         if pause_options[pause_selected] == "Resume":
                             paused = False
                         elif pause_options[pause_selected] == "Quit":
+                            if recorder:
+                                recorder.close(world.steps)
                             pygame.quit()
                             exit()
-                else:
-                    if event.key == pygame.K_LEFT:
-                        player.move_left()
-                    elif event.key == pygame.K_RIGHT:
-                        player.move_right()
-                    elif event.key == pygame.K_SPACE:
-                        player.shoot()
-                    elif event.key == pygame.K_UP:
-                        player.jump()
-            elif event.type == pygame.KEYUP and not paused:
-                if event.key in [pygame.K_LEFT, pygame.K_RIGHT]:
-                    player.stop()
+                elif playback is None:
+                    controls.handle(event)
+                    if recorder:
+                        recorder.record(world.steps, event)
+            elif event.type == pygame.KEYUP and not paused and playback is None:
+                controls.handle(event)
+                if recorder:
+                    recorder.record(world.steps, event)
 
         if paused:
+            # Game time stands still while paused
+            lag = 0
             draw_pause_menu()
+            renderer.invalidate()
             continue
 
-        screen.blit(background_image, (0, 0))
-
-        if level_in_progress:
-            all_sprites.update()
-
-            if pygame.time.get_ticks() - level_start_time > LEVEL_DURATION:
-                level_in_progress = False
-                level_complete_timer = pygame.time.get_ticks()
-
-            for bullet in projectiles:
-                enemies_hit = pygame.sprite.spritecollide(bullet, enemies, False)
-                for enemy in enemies_hit:
-                    enemy.health -= 10
-                    bullet.kill()
-                    player.score += 10
-
-            player_hit_list = pygame.sprite.spritecollide(player, enemies, False)
-            for hit in player_hit_list:
-                player.health -= 1
-                if player.health <= 0:
-                    player.lives -= 1
-                    player.health = 100
-                    if player.lives <= 0:
-                        game_over()
-
-            if len(enemies) == 0:
-                if current_wave < len(waves):
-                    for x, y in waves[current_wave]:
-                        enemy = Enemy(x, y, flying=(level == 3))
-                        all_sprites.add(enemy)
-                        enemies.add(enemy)
-                    current_wave += 1
-                elif not waves:
-                    pass
-                else:
-                    level_in_progress = False
-                    level_complete_timer = pygame.time.get_ticks()
-        else:
-            screen.fill(BLACK)
-            font = pygame.font.Font(None, 64)
-            text = font.render("Level Complete!", True, GREEN)
-            screen.blit(text, (SCREEN_WIDTH // 2 - 180, SCREEN_HEIGHT // 2 - 50))
-            pygame.display.flip()
-            if pygame.time.get_ticks() - level_complete_timer > 2000:
-                level += 1
-                if level > 3:
-                    screen.fill(BLACK)
-                    win_font = pygame.font.Font(None, 64)
-                    win_text = win_font.render("You Win! Congratulations!", True, GREEN)
-                    screen.blit(win_text, (SCREEN_WIDTH // 2 - 300, SCREEN_HEIGHT // 2 - 50))
-                    pygame.display.flip()
-                    pygame.time.wait(3000)
-                    running = False
-                else:
-                    player.health = 100
-                    player.lives = max(player.lives, 1)
-                    start_level(level)
-
-        draw_health_bar()
-        draw_score()
-        draw_lives()
-        draw_level()
-        draw_level_timer(LEVEL_DURATION)
-        all_sprites.draw(screen)
-        pygame.display.flip()
+        renderer.begin(world.all_sprites)
 
+        if playback is not None:
+            # One recorded step per frame, fed the keys recorded before it
+            for event in playback.events(world.steps):
+                controls.handle(event)
+            if "shoot" in world.step(controls.take()):
+                shoot_sound.play()
+            if world.steps >= playback.length:
+                running = False
+        else:
+            steps = 0
+            while lag >= STEP_MS and steps < MAX_STEPS_PER_FRAME:
+                if "shoot" in world.step(controls.take()):
+                    shoot_sound.play()
+                lag -= STEP_MS
+                steps += 1
+            if steps == MAX_STEPS_PER_FRAME:
+                lag = 0
+
+        if world.finished and recorder:
+            recorder.close(world.steps)
+        if world.state == game_sim.LOST:
+            game_over()
+            break
+        elif world.state == game_sim.WON:
+            draw_message("You Win! Congratulations!", GREEN, SCREEN_WIDTH // 2 - 300)
+            hold(3000)
+            break
+        elif world.state == game_sim.LEVEL_COMPLETE:
+            draw_message("Level Complete!", GREEN, SCREEN_WIDTH // 2 - 180)
+            renderer.invalidate()
+
+        draw_hud(renderer, world)
+        renderer.end(world.all_sprites)
+
+    if recorder:
+        recorder.close(world.steps)
+    if playback is not None:
+        seconds = (pygame.time.get_ticks() - replay_start) / 1000
+        print(f"Replayed {world.steps} steps in {seconds:.1f}s: {world.state}, score {world.player.score}")
+    if debug:
+        print(text_cache.stats())
     pygame.quit()
 
-def start_level(level_num):
-    global level_in_progress, current_wave, waves, level_start_time
-    enemies.empty()
-    all_sprites.empty()
-    projectiles.empty()
-    all_sprites.add(player)
-    current_wave = 0
-
-    if level_num == 1:
-        waves = [
-            [(SCREEN_WIDTH + 100 * i, SCREEN_HEIGHT - 70) for i in range(5)],
-            [(SCREEN_WIDTH + 150 * i, SCREEN_HEIGHT - 70) for i in range(6)]
-        ]
-    elif level_num == 2:
-        waves = [
-            [(SCREEN_WIDTH + 80 * i, SCREEN_HEIGHT - 70) for i in range(7)]
-        ]
-        boss = BossEnemy(health=150)
-        all_sprites.add(boss)
-        enemies.add(boss)
-    elif level_num == 3:
-        waves = [
-            [(SCREEN_WIDTH + 120 * i, SCREEN_HEIGHT - 70) for i in range(4)]
-        ]
-        for i in range(3):
-            flying_enemy = Enemy(SCREEN_WIDTH + 180 * i, SCREEN_HEIGHT - 150, flying=True)
-            all_sprites.add(flying_enemy)
-            enemies.add(flying_enemy)
-        boss = BossEnemy(health=200)
-        all_sprites.add(boss)
-        enemies.add(boss)
-
-    level_start_time = pygame.time.get_ticks()
-    level_in_progress = True
-
 if __name__ == "__main__":
     main()
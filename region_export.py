@@ -0,0 +1,76 @@
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from image_io import FILE_MODE, format_for, save_image
+from instrumentation import stage
+from resampling import BEST
+
+MANIFEST_NAME = "manifest.json"
+
+
+def region_path(out_dir, stem, index, ext):
+    return os.path.join(out_dir, f"{stem}_{index + 1:03d}{ext}")
+
+
+def clamp_region(rect, width, height):
+    x0, y0, x1, y1 = rect
+    x0, x1 = sorted((max(0, min(x0, width)), max(0, min(x1, width))))
+    y0, y1 = sorted((max(0, min(y0, height)), max(0, min(y1, height))))
+    if x1 - x0 < 1 or y1 - y0 < 1:
+        raise ValueError(f"Region {rect} is outside a {width}x{height} image")
+    return x0, y0, x1, y1
+
+
+def export_regions(snapshot, regions, out_dir, ext=".png", options=None, stem="region", source=None, workers=None):
+    # Renders the edited image once; every region is a view into that result, so
+    # there is no per-region render, copy or history entry. The regions are encoded
+    # in parallel (OpenCV releases the GIL while encoding) and listed in a manifest.
+    fmt = format_for(stem + ext)
+    os.makedirs(out_dir, exist_ok=True)
+    start = time.perf_counter()
+    with stage("export.render"):
+        img = snapshot.render(quality=BEST)
+    height, width = img.shape[:2]
+    rects = [clamp_region(rect, width, height) for rect in regions]
+    paths = [region_path(out_dir, stem, i, ext) for i in range(len(rects))]
+
+    def encode(i):
+        x0, y0, x1, y1 = rects[i]
+        return save_image(paths[i], img[y0:y1, x0:x1], options)
+
+    with stage("export.encode", regions=len(rects)):
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 2, thread_name_prefix="export") as pool:
+            reports = list(pool.map(encode, range(len(rects))))
+
+    manifest = {
+        "source": source,
+        "ops": snapshot.ops,
+        "gray": snapshot.gray,
+        "width": width,
+        "height": height,
+        "format": fmt,
+        "regions": [{"file": os.path.basename(path), "rect": list(rect), "width": rect[2] - rect[0],
+                     "height": rect[3] - rect[1], "bytes": report["bytes"]}
+                    for path, rect, report in zip(paths, rects, reports)],
+    }
+    manifest_path = os.path.join(out_dir, MANIFEST_NAME)
+    # Same temp file and rename as save_image, so a manifest is never half written
+    fd, tmp_path = tempfile.mkstemp(dir=out_dir, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.chmod(tmp_path, FILE_MODE)
+        os.replace(tmp_path, manifest_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return {
+        "dir": out_dir,
+        "manifest": manifest_path,
+        "count": len(rects),
+        "bytes": sum(report["bytes"] for report in reports),
+        "seconds": time.perf_counter() - start,
+    }
@@ -0,0 +1,141 @@
+import argparse
+import os
+import random
+import struct
+import sys
+import time
+
+import pygame
+
+import game_sim
+
+# Input recordings: the seed of a run and every key press and release fed to the game,
+# stamped with the tick (world step or frame) it was applied before. Playing them back
+# into a game seeded the same way reproduces the run exactly, and with RABBIT_UNCAPPED
+# set the game runs through them as fast as it can instead of at FPS.
+#
+# File layout, little-endian: a header (magic, format version, game name, seed), then
+# one 9-byte record per key event (tick, kind, key) in tick order, closed by an END
+# record at the tick the run stopped.
+RECORD_ENV = "RABBIT_RECORD"        # path to record this run to
+REPLAY_ENV = "RABBIT_REPLAY"        # path of a recording to play instead of the keyboard
+SEED_ENV = "RABBIT_SEED"            # seed for a new run; random if unset
+UNCAPPED_ENV = "RABBIT_UNCAPPED"    # replay without the frame cap or waits
+
+MAGIC = b"RBRP"
+VERSION = 1
+HEADER = struct.Struct("<4sB8sQ")
+RECORD = struct.Struct("<IBI")
+KEY_DOWN, KEY_UP, END = 0, 1, 2
+KINDS = {pygame.KEYDOWN: KEY_DOWN, pygame.KEYUP: KEY_UP}
+EVENT_TYPES = {KEY_DOWN: pygame.KEYDOWN, KEY_UP: pygame.KEYUP}
+
+
+class Recorder:
+    def __init__(self, path, game, seed):
+        self.path = path
+        self.file = open(path, "wb")
+        self.file.write(HEADER.pack(MAGIC, VERSION, game.encode(), seed))
+        self.count = 0
+
+    def record(self, tick, event):
+        # Log a key event that is applied before step `tick`; other events are ignored
+        kind = KINDS.get(event.type)
+        if kind is not None and self.file is not None:
+            self.file.write(RECORD.pack(tick, kind, event.key))
+            self.count += 1
+
+    def close(self, tick):
+        # Mark the end of the run; safe to call more than once
+        if self.file is not None:
+            self.file.write(RECORD.pack(tick, END, 0))
+            self.file.close()
+            self.file = None
+            print(f"Recorded {self.count} key events over {tick} ticks to {self.path}")
+
+
+class Replay:
+    def __init__(self, path, game=None):
+        with open(path, "rb") as f:
+            data = f.read()
+        magic, version, name, self.seed = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} input recording")
+        self.game = name.rstrip(b"\0").decode()
+        if game is not None and self.game != game:
+            raise ValueError(f"{path} was recorded in '{self.game}', not '{game}'")
+
+        self.ticks = {}   # tick -> [(kind, key)]
+        self.length = 0
+        self.complete = False
+        end = len(data) - (len(data) - HEADER.size) % RECORD.size
+        for tick, kind, key in RECORD.iter_unpack(data[HEADER.size:end]):
+            if kind == END:
+                self.complete = True
+                self.length = tick
+                break
+            self.ticks.setdefault(tick, []).append((kind, key))
+            self.length = tick + 1
+        # A run that crashed has no END record; it plays up to its last event
+
+    def events(self, tick):
+        # The key events to apply before step `tick`, as pygame events
+        return [pygame.event.Event(EVENT_TYPES[kind], key=key) for kind, key in self.ticks.get(tick, ())]
+
+
+def uncapped():
+    return os.environ.get(UNCAPPED_ENV, "") not in ("", "0")
+
+
+def open_from_env(game):
+    # (seed, recorder, replay) for a run of `game` as the RABBIT_* variables ask; the
+    # seed comes from the recording when replaying. Recorder and replay may be None.
+    playback = None
+    if os.environ.get(REPLAY_ENV):
+        playback = Replay(os.environ[REPLAY_ENV], game)
+        seed = playback.seed
+    elif os.environ.get(SEED_ENV):
+        seed = int(os.environ[SEED_ENV])
+    else:
+        seed = random.randrange(2 ** 32)
+    recorder = Recorder(os.environ[RECORD_ENV], game, seed) if os.environ.get(RECORD_ENV) else None
+    return seed, recorder, playback
+
+
+def main(argv=None):
+    # Replay a rabbit_game.py recording headlessly, timing every step
+    parser = argparse.ArgumentParser(description="Replay a rabbit_game.py recording without a window.")
+    parser.add_argument("recording")
+    parser.add_argument("--top", type=int, default=10, help="slowest steps to list")
+    args = parser.parse_args(argv)
+
+    pygame.init()
+    playback = Replay(args.recording, game_sim.GAME)
+    world = game_sim.World(seed=playback.seed)
+    controls = game_sim.Controls()
+    times = []
+    start = time.perf_counter()
+    while world.steps < playback.length and not world.finished:
+        tick = world.steps
+        step_start = time.perf_counter()
+        for event in playback.events(tick):
+            controls.handle(event)
+        world.step(controls.take())
+        times.append((1000 * (time.perf_counter() - step_start), tick))
+    elapsed = time.perf_counter() - start
+
+    print(f"{world.steps} steps in {elapsed:.2f}s ({world.steps / elapsed:.0f} steps/s): {world.state} "
+          f"at level {min(world.level, game_sim.LAST_LEVEL)}, score {world.player.score}, lives {world.player.lives}")
+    if not playback.complete:
+        print("The recording has no end marker; the run it came from did not finish cleanly")
+    print("Slowest steps:")
+    for ms, tick in sorted(times, reverse=True)[:args.top]:
+        print(f"  step {tick:>6}  {ms:7.3f} ms")
+    pygame.quit()
+    return 0
+
+
+if __name__ == "__main__":
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    sys.exit(main())
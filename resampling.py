@@ -0,0 +1,65 @@
+import cv2
+import numpy as np
+import PIL
+from PIL import Image
+
+import tiling
+
+# Quality modes for resizing:
+#   "fast"      previews and thumbnails: halves with 2x2 averaging while at least
+#               2x too large, then one bilinear step
+#   "balanced"  the editor's display: halves while at least 4x too large, then
+#               area averaging; bicubic when enlarging
+#   "best"      export: area averaging in one step when shrinking (OpenCV's Lanczos
+#               does not widen its kernel for reductions and would alias), Lanczos
+#               when enlarging. Pillow-SIMD's antialiased Lanczos is used instead
+#               when it is installed.
+FAST = "fast"
+BALANCED = "balanced"
+BEST = "best"
+QUALITIES = (FAST, BALANCED, BEST)
+
+# Pillow-SIMD keeps Pillow's version number with a ".postN" suffix
+PILLOW_SIMD = ".post" in PIL.__version__
+# Channels are resampled independently, so BGR(A) can pass as Pillow's RGB(A)
+PILLOW_CHANNELS = (1, 3, 4)
+
+# Stop halving once the image is less than this many times larger than the target
+HALVING_GAPS = {FAST: 2, BALANCED: 4}
+SHRINK = {FAST: cv2.INTER_LINEAR, BALANCED: cv2.INTER_AREA, BEST: cv2.INTER_AREA}
+ENLARGE = {FAST: cv2.INTER_LINEAR, BALANCED: cv2.INTER_CUBIC, BEST: cv2.INTER_LANCZOS4}
+
+
+def interpolation(src_size, size, quality=BALANCED):
+    # OpenCV filter for one resize step from src_size to size (both (width, height))
+    shrink = size[0] * size[1] < src_size[0] * src_size[1]
+    return (SHRINK if shrink else ENLARGE)[quality]
+
+
+def halve(img, size, gap):
+    # 2x2 averaging steps (bilinear at exactly half size) while both sides are at
+    # least `gap` times the target; each step reads a quarter of the previous one
+    while img.shape[1] >= gap * size[0] and img.shape[0] >= gap * size[1]:
+        img = cv2.resize(img, (img.shape[1] // 2, img.shape[0] // 2), interpolation=cv2.INTER_LINEAR)
+    return img
+
+
+def resize(img, size, quality=BALANCED, out=None):
+    size = tuple(size)
+    if quality not in QUALITIES:
+        raise ValueError(f"Unknown resampling quality: {quality}")
+    if (img.shape[1], img.shape[0]) == size and out is None:
+        return img
+    src_size = (img.shape[1], img.shape[0])
+    method = interpolation(src_size, size, quality)
+    # Images too large for RAM take the separable strip path in a single step
+    if tiling.out_of_core(img, (size[1], size[0]) + img.shape[2:]) or out is not None:
+        return tiling.resize(img, size, method, out)
+
+    channels = 1 if img.ndim == 2 else img.shape[2]
+    if quality == BEST and PILLOW_SIMD and img.dtype == np.uint8 and channels in PILLOW_CHANNELS:
+        pil_img = Image.fromarray(img)
+        return np.asarray(pil_img.resize(size, Image.LANCZOS, reducing_gap=3.0))
+    if quality in HALVING_GAPS:
+        img = halve(img, size, HALVING_GAPS[quality])
+    return cv2.resize(img, size, interpolation=method)
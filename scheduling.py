@@ -0,0 +1,91 @@
+import time
+
+FRAME_MS = 16
+DEBOUNCE_MS = 30
+
+
+class FrameThrottle:
+    # Coalesces bursts of calls (e.g. <B1-Motion> events) into at most one callback
+    # per frame interval, always with the latest arguments. Latency is measured from
+    # the first coalesced call to the end of the callback that served it.
+    def __init__(self, root, callback, interval_ms=FRAME_MS):
+        self.root = root
+        self.callback = callback
+        self.interval_ms = interval_ms
+        self.after_id = None
+        self.pending_args = None
+        self.pending_since = None
+        self.last_run = 0.0
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.calls = 0
+        self.runs = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def __call__(self, *args):
+        self.calls += 1
+        self.pending_args = args
+        if self.pending_since is None:
+            self.pending_since = time.perf_counter()
+        if self.after_id is None:
+            elapsed_ms = (time.perf_counter() - self.last_run) * 1000
+            delay = max(0, int(self.interval_ms - elapsed_ms))
+            self.after_id = self.root.after(delay, self._run)
+
+    def cancel(self):
+        if self.after_id is not None:
+            self.root.after_cancel(self.after_id)
+        self.after_id = None
+        self.pending_args = None
+        self.pending_since = None
+
+    def flush(self):
+        # Run a pending callback right away (e.g. on mouse release)
+        if self.after_id is not None:
+            self.root.after_cancel(self.after_id)
+            self._run()
+
+    def _run(self):
+        self.after_id = None
+        if self.pending_args is None:
+            return
+        args, since = self.pending_args, self.pending_since
+        self.pending_args = self.pending_since = None
+        self.callback(*args)
+        self.last_run = time.perf_counter()
+        latency = self.last_run - since
+        self.runs += 1
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+
+    def stats(self):
+        return {
+            "calls": self.calls,
+            "runs": self.runs,
+            "mean_latency_ms": 1000 * self.total_latency / self.runs if self.runs else 0.0,
+            "max_latency_ms": 1000 * self.max_latency,
+        }
+
+
+class Debouncer:
+    # Runs the callback once calls have stopped arriving for `delay_ms`
+    def __init__(self, root, callback, delay_ms=DEBOUNCE_MS):
+        self.root = root
+        self.callback = callback
+        self.delay_ms = delay_ms
+        self.after_id = None
+
+    def __call__(self, *args):
+        self.cancel()
+        self.after_id = self.root.after(self.delay_ms, self._run, *args)
+
+    def cancel(self):
+        if self.after_id is not None:
+            self.root.after_cancel(self.after_id)
+        self.after_id = None
+
+    def _run(self, *args):
+        self.after_id = None
+        self.callback(*args)
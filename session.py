@@ -0,0 +1,113 @@
+import os
+import shutil
+import tempfile
+from collections import OrderedDict
+
+import luma
+from image_ops import resident_bytes
+from image_pipeline import Pipeline
+
+
+class Document:
+    # One open image: its edit pipeline and history plus what the editor shows for it.
+    # `pipeline` and `pyramid` are None while the document is evicted from memory;
+    # the history's checkpoint is enough to rebuild the pipeline without decoding.
+    def __init__(self, path, pipeline, history):
+        self.path = path
+        self.pipeline = pipeline
+        self.history = history
+        self.pyramid = None
+        self.view = None              # (zoom, origin) of the viewport, None to fit
+        self.thumbnail = None         # small 8-bit image for the filmstrip
+        self.other_view = None        # (gray, source, ops, pyramid) of the view mode not shown
+        self.is_grayscale = False
+        self.is_flipped = False
+        self.resize_enabled = False   # the resize slider unlocks after the first edit
+
+    @property
+    def name(self):
+        return os.path.basename(self.path) if self.path else "untitled"
+
+    def set_pyramid(self, pyramid):
+        self.pyramid = pyramid
+        self.thumbnail = pyramid.levels[-1].copy()
+
+    def arrays(self):
+        arrays = self.history.arrays() if self.history is not None else []
+        if self.pipeline is not None:
+            arrays += self.pipeline.buffers()
+        if self.pyramid is not None:
+            arrays += self.pyramid.levels
+        if self.other_view is not None:
+            arrays += self.other_view[3].levels
+        return arrays + luma.planes(arrays)
+
+    def evict(self, spill_dir):
+        luma.drop(self.arrays())
+        self.history.spill(spill_dir)
+        self.pipeline = None
+        self.pyramid = None
+        self.other_view = None
+
+    def restore(self):
+        if self.pipeline is None:
+            self.pipeline = Pipeline(*self.history.checkpoint(), gray=self.is_grayscale)
+
+
+class Session:
+    # The open documents in filmstrip order, with an LRU of the ones kept in memory.
+    # When the resident documents exceed the cap the least recently shown ones are
+    # evicted and their undo history is spilled to a temporary directory.
+    def __init__(self, cache_mb):
+        self.cache_bytes = int(cache_mb * 1024 * 1024)
+        self.documents = []
+        self.lru = OrderedDict()   # id(document) -> document, most recent last
+        self.spill_root = None
+
+    def find(self, path):
+        path = os.path.normcase(os.path.abspath(path))
+        for doc in self.documents:
+            if doc.path is not None and os.path.normcase(os.path.abspath(doc.path)) == path:
+                return doc
+        return None
+
+    def add(self, doc):
+        self.documents.append(doc)
+        self.lru[id(doc)] = doc
+
+    def activate(self, doc):
+        doc.restore()
+        self.lru[id(doc)] = doc
+        self.lru.move_to_end(id(doc))
+
+    def remove(self, doc):
+        self.documents.remove(doc)
+        self.lru.pop(id(doc), None)
+        if self.spill_root is not None:
+            shutil.rmtree(self.spill_dir(doc), ignore_errors=True)
+
+    def memory_bytes(self):
+        return resident_bytes(img for doc in self.lru.values() for img in doc.arrays())
+
+    def enforce(self, active):
+        # Evict least recently used documents (never the active one) until under the cap
+        for doc in list(self.lru.values()):
+            if self.memory_bytes() <= self.cache_bytes:
+                break
+            if doc is active:
+                continue
+            doc.evict(self.spill_dir(doc))
+            del self.lru[id(doc)]
+
+    def spill_dir(self, doc):
+        if self.spill_root is None:
+            self.spill_root = tempfile.mkdtemp(prefix="image-editor-")
+        return os.path.join(self.spill_root, str(id(doc)))
+
+    def close(self):
+        self.documents.clear()
+        self.lru.clear()
+        if self.spill_root is not None:
+            shutil.rmtree(self.spill_root, ignore_errors=True)
+            self.spill_root = None
+
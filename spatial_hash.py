@@ -0,0 +1,84 @@
+import pygame
+
+CELL_SIZE = 64   # a little larger than the game's 50x50 sprites
+
+
+class SpatialGroup(pygame.sprite.Group):
+    # A sprite group that also files its sprites in a uniform grid, so a collision
+    # query only tests the sprites in the cells a rect overlaps and its cost follows
+    # the local density rather than the size of the group. Sprites are filed when
+    # added, dropped when killed, and re-filed by update()/rehash() after they move.
+    # Cells hold dicts rather than sets so results come out in a reproducible order.
+    def __init__(self, *sprites, cell_size=CELL_SIZE):
+        self.cell_size = cell_size
+        self.cells = {}   # (cx, cy) -> {sprite: None}
+        self.spans = {}   # sprite -> (cx0, cy0, cx1, cy1) it is filed under
+        super().__init__(*sprites)
+
+    def span(self, rect):
+        size = self.cell_size
+        return (rect.left // size, rect.top // size,
+                (rect.right - 1) // size, (rect.bottom - 1) // size)
+
+    def _file(self, sprite, span):
+        cx0, cy0, cx1, cy1 = span
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                self.cells.setdefault((cx, cy), {})[sprite] = None
+
+    def _unfile(self, sprite, span):
+        cx0, cy0, cx1, cy1 = span
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                cell = self.cells[(cx, cy)]
+                del cell[sprite]
+                if not cell:
+                    del self.cells[(cx, cy)]
+
+    def add_internal(self, sprite, layer=None):
+        super().add_internal(sprite, layer)
+        span = self.spans[sprite] = self.span(sprite.rect)
+        self._file(sprite, span)
+
+    def remove_internal(self, sprite):
+        super().remove_internal(sprite)
+        self._unfile(sprite, self.spans.pop(sprite))
+
+    def rehash(self):
+        # Re-file the sprites that moved into other cells; call after moving them
+        # through another group (e.g. all_sprites.update())
+        for sprite, span in list(self.spans.items()):
+            new_span = self.span(sprite.rect)
+            if new_span != span:
+                self._unfile(sprite, span)
+                self._file(sprite, new_span)
+                self.spans[sprite] = new_span
+
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self.rehash()
+
+    def query(self, rect):
+        # Sprites whose rect overlaps `rect`
+        cx0, cy0, cx1, cy1 = self.span(rect)
+        if cx0 == cx1 and cy0 == cy1:
+            candidates = self.cells.get((cx0, cy0), ())
+        else:
+            candidates = {}
+            for cx in range(cx0, cx1 + 1):
+                for cy in range(cy0, cy1 + 1):
+                    candidates.update(self.cells.get((cx, cy), ()))
+        return [sprite for sprite in candidates if rect.colliderect(sprite.rect)]
+
+    def collide(self, sprite):
+        # Like pygame.sprite.spritecollide(sprite, self, False)
+        return self.query(sprite.rect)
+
+    def groupcollide(self, group):
+        # Like pygame.sprite.groupcollide(group, self, False, False): {sprite: [hits]}
+        hits = {}
+        for sprite in group:
+            found = self.query(sprite.rect)
+            if found:
+                hits[sprite] = found
+        return hits
@@ -0,0 +1,12 @@
+import pytest
+
+import batch_process
+
+
+@pytest.mark.parametrize("recipe", ["bogus", "resize=abc", "crop=1,2,3"])
+def test_invalid_recipe_is_a_usage_error(recipe, tmp_path, capsys):
+    with pytest.raises(SystemExit) as exit_info:
+        batch_process.main([str(tmp_path), recipe, "-o", str(tmp_path / "out")])
+    assert exit_info.value.code == 2
+    assert "invalid recipe" in capsys.readouterr().err
+    assert not (tmp_path / "out").exists()
@@ -0,0 +1,117 @@
+import numpy as np
+import pytest
+
+import benchmark_editor
+
+# The editor runs on the benchmark's headless Tk stub
+benchmark_editor.install_tk_stub()
+
+import tkinter
+
+import luma
+from image_pipeline import Pipeline
+from resampling import BEST
+
+
+@pytest.fixture
+def bench(tmp_path):
+    bench = benchmark_editor.EditorBench(tkinter.Tk(), cache_dir=tmp_path)
+    bench.load(benchmark_editor.synthetic_image(0.05))
+    yield bench
+    bench.close()
+
+
+def test_resize_after_undo_redo_onto_keyframed_resize(bench):
+    # The editor no longer keyframes resized states (see color_render), so one is
+    # planted to cover commit_resize rebuilding from the entry before it
+    app = bench.app
+    source = app.pipeline.source
+    app.flip_horizontal()
+    app.resize_image("50")
+    app.commit_resize()
+    bench.wait()
+    app.history.entries[-1][1] = app.pipeline.render()
+
+    app.undo()
+    app.redo()
+    bench.wait()
+    assert app.pipeline.ops == []   # rebuilt from that keyframe
+
+    app.resize_image("60")
+    app.commit_resize()
+    bench.wait()
+    op = app.history.top_op()
+    assert op[0] == "resize" and op[1] == app.pipeline.size()
+    assert len(app.history.entries) == 2
+    assert np.array_equal(app.cv_img, Pipeline(source, [("flip",), op]).render())
+
+
+def test_export_quality_does_not_depend_on_the_undo_path(bench):
+    app = bench.app
+    source = app.pipeline.source
+    for _ in range(7):
+        app.flip_horizontal()
+    app.resize_image("50")
+    app.commit_resize()
+    bench.wait()
+    assert app.history.entries[-1][1] is None   # resized states are not keyframed
+
+    app.undo()
+    app.redo()
+    bench.wait()
+    expected = Pipeline(source, [("flip",)] * 7 + [app.history.top_op()])
+    assert np.array_equal(app.pipeline.render(quality=BEST), expected.render(quality=BEST))
+
+
+def test_regions_follow_a_resize(bench):
+    app = bench.app
+    width, height = app.pipeline.size()
+    app.flip_horizontal()
+    bench.wait()
+    app.regions = [(width // 2, height // 2, width - 2, height - 2)]
+    app.resize_image("50")
+    app.export_regions()   # commits the pending resize first
+    bench.wait()
+    new_width, new_height = app.pipeline.size()
+    assert (new_width, new_height) == (width // 2, height // 2)
+    x1, y1, x2, y2 = app.regions[0]
+    assert (x1, y1) == (round(width // 2 * new_width / width), round(height // 2 * new_height / height))
+    assert x2 <= new_width and y2 <= new_height
+
+
+def test_jobs_keep_polling_after_a_failing_callback(bench):
+    def fail(result):
+        raise RuntimeError("callback failed")
+
+    results = []
+    jobs = bench.app.jobs
+    jobs.submit("a", lambda: 1, on_done=fail)
+    bench.wait()
+    jobs.submit("b", lambda: 2, on_done=results.append)
+    bench.wait()
+    assert results == [2] and not jobs.polling
+
+
+def test_adjust_preview_keeps_full_resolution_coordinates(bench):
+    # Large enough that the fitted view is drawn from a reduced level
+    bench.load(benchmark_editor.synthetic_image(4))
+    app = bench.app
+    base = app.viewport.pyramid
+    before = app.viewport.canvas_to_image(200, 150)
+    app.show_adjust_preview(base, (("brightness", 40),))
+    assert (app.viewport.pyramid.width, app.viewport.pyramid.height) == app.pipeline.size()
+    assert app.viewport.canvas_to_image(200, 150) == before
+    level = base.level_for(app.viewport.zoom)
+    assert app.viewport.pyramid.tile(level, 0, 0).mean() > base.tile(level, 0, 0).mean()
+
+
+def test_luma_planes_count_toward_document_memory(bench):
+    app = bench.app
+    app.toggle_grayscale()
+    bench.wait()
+    source = app.pipeline.source
+    plane = luma.planes([source])
+    assert plane and any(img is plane[0] for img in app.document.arrays())
+
+    app.document.evict(app.session.spill_dir(app.document))
+    assert luma.planes([source]) == []
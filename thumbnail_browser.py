@@ -0,0 +1,166 @@
+import os
+import tkinter as tk
+from collections import OrderedDict
+from tkinter import filedialog
+
+from PIL import ImageTk
+
+from display_pyramid import to_pil
+from image_io import collect_inputs
+from jobs import JobRunner
+from scheduling import FrameThrottle
+
+CELL_SIZE = 104        # thumbnail box; the file name goes underneath
+LABEL_HEIGHT = 28
+COLUMNS = 2
+PREFETCH_ROWS = 6      # rows beyond the visible ones whose thumbnails are prepared too
+TK_CACHE_SIZE = 400    # Tk images kept for cells that scroll back into view
+
+
+class ThumbnailBrowser:
+    # Folder view next to the preview. Only the visible cells are drawn; their
+    # thumbnails come from the on-disk cache, and missing ones are made on a
+    # separate worker pool so a folder of thousands of photos never blocks editing.
+    def __init__(self, parent, cache, on_open):
+        self.cache = cache
+        self.on_open = on_open
+        self.paths = []
+        self.indices = {}             # path -> position in the grid
+        self.thumbs = OrderedDict()   # path -> (PhotoImage, width, height)
+        self.failed = set()
+        self.pending = set()
+        # Its own pool, so thumbnail work never queues in front of the editor's renders
+        self.jobs = JobRunner(parent)
+        # Thumbnails arriving together are drawn in one pass
+        self.redraw_throttle = FrameThrottle(parent, self.redraw)
+
+        self.frame = tk.Frame(parent)
+        tk.Button(self.frame, text="Browse Folder", command=self.choose_folder).pack(fill=tk.X)
+        self.label = tk.Label(self.frame, text="No folder", anchor="w")
+        self.label.pack(fill=tk.X)
+        self.scrollbar = tk.Scrollbar(self.frame, orient=tk.VERTICAL, command=self.on_scroll)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.canvas = tk.Canvas(self.frame, width=COLUMNS * CELL_SIZE, bg="#2b2b2b", highlightthickness=0,
+                                yscrollcommand=self.scrollbar.set)
+        self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.canvas.bind("<Configure>", lambda e: self.redraw())
+        self.canvas.bind("<Button-1>", self.on_click)
+        self.canvas.bind("<MouseWheel>", lambda e: self.on_scroll("scroll", -1 if e.delta > 0 else 1, "units"))
+        self.canvas.bind("<Button-4>", lambda e: self.on_scroll("scroll", -1, "units"))
+        self.canvas.bind("<Button-5>", lambda e: self.on_scroll("scroll", 1, "units"))
+
+    def choose_folder(self):
+        folder = filedialog.askdirectory(title="Select a folder of images")
+        if folder:
+            self.open_folder(folder)
+
+    def open_folder(self, folder):
+        for path in self.pending:
+            self.jobs.cancel(path)
+        self.pending.clear()
+        self.failed.clear()
+        self.paths = collect_inputs(folder)
+        self.indices = {path: i for i, path in enumerate(self.paths)}
+        self.label.config(text=f"{os.path.basename(os.path.normpath(folder))}: {len(self.paths)} images")
+        rows = (len(self.paths) + COLUMNS - 1) // COLUMNS
+        self.canvas.config(scrollregion=(0, 0, COLUMNS * CELL_SIZE, rows * (CELL_SIZE + LABEL_HEIGHT)),
+                           yscrollincrement=(CELL_SIZE + LABEL_HEIGHT) // 2)
+        self.canvas.yview_moveto(0)
+        self.redraw()
+
+    def on_scroll(self, *args):
+        self.canvas.yview(*args)
+        self.redraw()
+
+    def visible_rows(self):
+        row_height = CELL_SIZE + LABEL_HEIGHT
+        top = self.canvas.canvasy(0)
+        bottom = top + max(1, self.canvas.winfo_height())
+        return int(top // row_height), int(bottom // row_height)
+
+    def redraw(self):
+        self.canvas.delete("cell")
+        if not self.paths:
+            return
+        first, last = self.visible_rows()
+        for index in range(first * COLUMNS, min(len(self.paths), (last + 1) * COLUMNS)):
+            self.draw_cell(index)
+        self.prefetch(first, last + PREFETCH_ROWS)
+
+    def draw_cell(self, index):
+        path = self.paths[index]
+        row, col = divmod(index, COLUMNS)
+        x = col * CELL_SIZE + CELL_SIZE // 2
+        y = row * (CELL_SIZE + LABEL_HEIGHT) + CELL_SIZE // 2
+        thumb = self.thumbnail(path)
+        if thumb is not None:
+            tk_img, width, height = thumb
+            self.canvas.create_image(x, y, image=tk_img, tags="cell")
+            caption = f"{os.path.basename(path)[:16]}\n{width}x{height}"
+        else:
+            self.canvas.create_rectangle(x - 40, y - 30, x + 40, y + 30, outline="#555555", tags="cell")
+            caption = os.path.basename(path)[:16]
+        self.canvas.create_text(x, y + CELL_SIZE // 2 + LABEL_HEIGHT // 2, text=caption, fill="white",
+                                font=("Arial", 7), justify=tk.CENTER, tags="cell")
+
+    def thumbnail(self, path):
+        # Tk image for a cell, read from the disk cache if it is already there
+        thumb = self.thumbs.get(path)
+        if thumb is not None:
+            self.thumbs.move_to_end(path)
+            return thumb
+        if path in self.failed or path in self.pending:
+            return None
+        cached = self.cache.get(path)
+        if cached is None:
+            return None
+        return self.add_thumbnail(path, cached)
+
+    def add_thumbnail(self, path, result):
+        img, width, height = result
+        pil_img = to_pil(img)
+        pil_img.thumbnail((CELL_SIZE - 8, CELL_SIZE - 8))
+        thumb = (ImageTk.PhotoImage(pil_img), width, height)
+        self.thumbs[path] = thumb
+        if len(self.thumbs) > TK_CACHE_SIZE:
+            self.thumbs.popitem(last=False)
+        return thumb
+
+    def prefetch(self, first_row, last_row):
+        # Make the missing thumbnails around the view; requests for cells that were
+        # scrolled far away are dropped before they start
+        wanted = set(self.paths[first_row * COLUMNS:(last_row + 1) * COLUMNS])
+        for path in self.pending - wanted:
+            self.jobs.cancel(path)
+        self.pending &= wanted
+        for path in wanted:
+            if path in self.thumbs or path in self.failed or path in self.pending:
+                continue
+            self.pending.add(path)
+            self.jobs.submit(path, self.cache.get_or_create, path,
+                             on_done=lambda result, path=path: self.on_thumbnail(path, result),
+                             on_error=lambda error, path=path: self.on_failed(path))
+
+    def on_thumbnail(self, path, result):
+        self.pending.discard(path)
+        self.add_thumbnail(path, result)
+        index = self.indices.get(path, -1)
+        first, last = self.visible_rows()
+        if first * COLUMNS <= index < (last + 1) * COLUMNS:
+            self.redraw_throttle()
+
+    def on_failed(self, path):
+        self.pending.discard(path)
+        self.failed.add(path)
+
+    def on_click(self, event):
+        row = int(self.canvas.canvasy(event.y) // (CELL_SIZE + LABEL_HEIGHT))
+        col = int(event.x // CELL_SIZE)
+        index = row * COLUMNS + col
+        if col < COLUMNS and 0 <= index < len(self.paths):
+            self.on_open(self.paths[index])
+
+    def close(self):
+        self.redraw_throttle.cancel()
+        self.jobs.shutdown()
+        self.cache.close()
@@ -0,0 +1,126 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import cv2
+import numpy as np
+
+import resampling
+from image_io import choose_reduction, probe_size, read_image
+from image_ops import to_8bit
+
+THUMB_SIZE = 128      # long side of stored thumbnails
+THUMB_QUALITY = 85
+MAX_ENTRIES = 5000    # thumbnails kept across sessions; the oldest go first
+DEFAULT_CACHE_PATH = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"),
+                                  "image_editor", "thumbnails.sqlite")
+
+
+def cache_key(path, stat):
+    # Changes whenever the file is replaced or modified, so stale thumbnails are never served
+    text = f"{os.path.abspath(path)}\0{stat.st_mtime_ns}\0{stat.st_size}"
+    return hashlib.sha1(text.encode("utf-8", "surrogateescape")).hexdigest()
+
+
+def make_thumbnail(path, size=THUMB_SIZE):
+    # Decodes at the largest reduction that still covers `size` (DCT scaling for JPEG),
+    # returns (thumbnail, original width, original height)
+    width, height = probe_size(path)
+    img = read_image(path, choose_reduction((width, height), size))
+    if img is None:
+        raise IOError(f"Could not read {path}")
+    img = to_8bit(img)
+    scale = size / max(img.shape[:2])
+    if scale < 1:
+        thumb_size = (max(1, round(img.shape[1] * scale)), max(1, round(img.shape[0] * scale)))
+        img = resampling.resize(img, thumb_size, resampling.FAST)
+    if img.ndim == 3 and img.shape[2] == 4:
+        img = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
+    return img, width, height
+
+
+class ThumbnailCache:
+    # Thumbnails and image sizes in one SQLite file, keyed by a hash of path, mtime
+    # and file size. Safe to use from several threads: each gets its own connection.
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=MAX_ENTRIES):
+        self.path = path
+        self.local = threading.local()
+        self.connections = []   # every thread's connection, so close() can reach them all
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        db = self._db()
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("""CREATE TABLE IF NOT EXISTS thumbnails (
+                          key TEXT PRIMARY KEY,
+                          path TEXT NOT NULL,
+                          width INTEGER NOT NULL,
+                          height INTEGER NOT NULL,
+                          data BLOB NOT NULL,
+                          created REAL NOT NULL)""")
+        db.execute("CREATE INDEX IF NOT EXISTS thumbnails_path ON thumbnails (path)")
+        db.commit()
+        self.prune(max_entries)
+
+    def _db(self):
+        db = getattr(self.local, "db", None)
+        if db is None:
+            # Only the owning thread uses it; the check is off so close() may close it
+            db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            db.execute("PRAGMA synchronous=NORMAL")
+            self.local.db = db
+            with self.lock:
+                self.connections.append(db)
+        return db
+
+    def get(self, path):
+        # (thumbnail, width, height) if a current thumbnail is stored, else None
+        try:
+            key = cache_key(path, os.stat(path))
+        except OSError:
+            return None
+        row = self._db().execute("SELECT data, width, height FROM thumbnails WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        thumb = cv2.imdecode(np.frombuffer(row[0], np.uint8), cv2.IMREAD_UNCHANGED)
+        if thumb is None:
+            return None
+        return thumb, row[1], row[2]
+
+    def put(self, path, thumb, width, height):
+        key = cache_key(path, os.stat(path))
+        ok, data = cv2.imencode(".jpg", thumb, [cv2.IMWRITE_JPEG_QUALITY, THUMB_QUALITY])
+        if not ok:
+            raise IOError(f"Could not encode the thumbnail of {path}")
+        path = os.path.abspath(path)
+        db = self._db()
+        with db:
+            # Thumbnails of earlier versions of the file are no longer reachable
+            db.execute("DELETE FROM thumbnails WHERE path = ? AND key != ?", (path, key))
+            db.execute("INSERT OR REPLACE INTO thumbnails VALUES (?, ?, ?, ?, ?, ?)",
+                       (key, path, width, height, data.tobytes(), time.time()))
+
+    def get_or_create(self, path):
+        # For worker threads: the stored thumbnail, or a new one that is then stored
+        cached = self.get(path)
+        if cached is not None:
+            return cached
+        thumb, width, height = make_thumbnail(path)
+        self.put(path, thumb, width, height)
+        return thumb, width, height
+
+    def prune(self, max_entries):
+        # Drop the oldest thumbnails beyond `max_entries`
+        db = self._db()
+        with db:
+            db.execute("DELETE FROM thumbnails WHERE key NOT IN "
+                       "(SELECT key FROM thumbnails ORDER BY created DESC LIMIT ?)", (max_entries,))
+
+    def close(self):
+        # Closes the connections of all threads, not just the caller's
+        with self.lock:
+            connections, self.connections = self.connections, []
+            self.local = threading.local()
+        for db in connections:
+            db.close()
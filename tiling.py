@@ -0,0 +1,154 @@
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+# Images below this size are processed with one OpenCV call; splitting them costs more than it saves
+TILED_MIN_PIXELS = 4_000_000
+# Target size of one strip, so a strip of input and output stays cache-resident
+STRIP_BYTES = 4 * 1024 * 1024
+# Decodes larger than this are memory-mapped, and work on memory maps of this size is
+# done out of core into file-backed buffers. Smaller memory maps (such as the spilled
+# history of an evicted document) are just paged in and processed like any array.
+OUT_OF_CORE_MB = 2048
+
+_executor = None
+
+
+def executor():
+    # Shared pool for strip work. It is separate from the editor's job pool, so a job
+    # that splits its image into strips never waits on a worker it is occupying.
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 2, thread_name_prefix="strip")
+    return _executor
+
+
+def is_large(img):
+    return img.shape[0] * img.shape[1] >= TILED_MIN_PIXELS
+
+
+def out_of_core(img, shape=None):
+    # Whether `img`, or a result of `shape` made from it, is too large for RAM
+    if not isinstance(img, np.memmap):
+        return False
+    nbytes = img.nbytes if shape is None else max(img.nbytes, int(np.prod(shape)) * img.itemsize)
+    return nbytes > OUT_OF_CORE_MB * 1024 * 1024
+
+
+def strips(length, unit_bytes, minimum=16):
+    # [start, stop) ranges covering `length` rows (or columns) of `unit_bytes` each
+    step = max(minimum, STRIP_BYTES // max(1, unit_bytes))
+    return [(start, min(start + step, length)) for start in range(0, length, step)]
+
+
+def allocate(shape, dtype, like):
+    # Results of out-of-core inputs go to a memory-mapped temp file as well, so
+    # editing an image larger than RAM never needs a full in-memory copy
+    if out_of_core(like, shape):
+        fd, path = tempfile.mkstemp(suffix=".strip")
+        os.close(fd)
+        try:
+            return np.memmap(path, dtype=dtype, mode="w+", shape=shape)
+        finally:
+            os.unlink(path)  # the mapping stays valid
+    return np.empty(shape, dtype)
+
+
+def run(tasks):
+    # Run callables on the strip pool and re-raise the first failure
+    for future in [executor().submit(task) for task in tasks]:
+        future.result()
+
+
+def _apply(fn, src, dst):
+    # OpenCV writes straight into `dst` when it can; strided column strips get a copy
+    result = fn(src, dst)
+    if result is not dst:
+        dst[...] = result
+
+
+def map_rows(fn, img, shape, dtype, out=None):
+    # fn(src_rows, dst_rows) over strips of rows into an output of `shape`. `fn` must
+    # treat rows independently (colour conversion, horizontal flip, horizontal resize).
+    if out is None:
+        out = allocate(shape, dtype, img)
+    if not is_large(img):
+        _apply(fn, img, out)
+        return out
+    ranges = strips(img.shape[0], max(img.strides[0], out.strides[0]))
+    run([lambda y0=y0, y1=y1: _apply(fn, img[y0:y1], out[y0:y1]) for y0, y1 in ranges])
+    return out
+
+
+def map_columns(fn, img, shape, dtype, out=None):
+    # Same as map_rows over strips of columns, for ops that treat columns independently
+    if out is None:
+        out = allocate(shape, dtype, img)
+    if not is_large(img):
+        _apply(fn, img, out)
+        return out
+    column_bytes = max(img.shape[0] * img.strides[1], out.shape[0] * out.strides[1])
+    # Wide enough that each row of a strip is still a long contiguous run
+    ranges = strips(img.shape[1], column_bytes, minimum=256)
+    run([lambda x0=x0, x1=x1: _apply(fn, img[:, x0:x1], out[:, x0:x1]) for x0, x1 in ranges])
+    return out
+
+
+def to_gray(img, code, flip=False, out=None):
+    # BGR(A) -> GRAY, optionally mirrored in the same pass over each strip
+    def fn(src, dst):
+        if not flip:
+            return cv2.cvtColor(src, code, dst=dst)
+        return cv2.flip(cv2.cvtColor(src, code), 1, dst=dst)
+    return map_rows(fn, img, img.shape[:2], img.dtype, out)
+
+
+def resize(img, size, interpolation, out=None):
+    # In-memory images go to a single cv2.resize call, which OpenCV already runs in
+    # parallel. Out-of-core images are resized in two separable passes (area and
+    # bicubic/Lanczos weights are all separable) over strips of rows and then of
+    # columns, into file-backed buffers. Bicubic and Lanczos keep a wider intermediate
+    # (int16 for 8-bit images) so overshoot is not clipped between the passes; area
+    # averaging cannot overshoot. Either way results stay within one level of a single call.
+    width, height = size
+    if not out_of_core(img, (height, width) + img.shape[2:]) and out is None:
+        return cv2.resize(img, size, interpolation=interpolation)
+
+    channels = img.shape[2:]
+    middle = img.dtype
+    if interpolation in (cv2.INTER_CUBIC, cv2.INTER_LANCZOS4):
+        middle = np.int16 if img.dtype == np.uint8 else np.float32
+
+    def horizontal(src, dst):
+        return cv2.resize(src.astype(middle, copy=False), (width, src.shape[0]), interpolation=interpolation)
+
+    def vertical(src, dst):
+        return cv2.resize(src.astype(middle, copy=False), (src.shape[1], height), interpolation=interpolation)
+
+    def finish(pass_fn):
+        def fn(src, dst):
+            return _cast(pass_fn(src, dst), img.dtype)
+        return fn
+
+    # Take the pass that leaves the smaller intermediate first
+    if out is None:
+        out = allocate((height, width) + channels, img.dtype, img)
+    if width * img.shape[0] <= img.shape[1] * height:
+        tmp = map_rows(horizontal, img, (img.shape[0], width) + channels, middle)
+        return map_columns(finish(vertical), tmp, out.shape, img.dtype, out)
+    tmp = map_columns(vertical, img, (height, img.shape[1]) + channels, middle)
+    return map_rows(finish(horizontal), tmp, out.shape, img.dtype, out)
+
+
+def _cast(result, dtype):
+    if result.dtype == dtype:
+        return result
+    if np.issubdtype(dtype, np.integer):
+        info = np.iinfo(dtype)
+        if not np.issubdtype(result.dtype, np.integer):
+            result = np.rint(result)
+        result = np.clip(result, info.min, info.max)
+    return result.astype(dtype)